@@ -1,24 +1,89 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
-import requests
-from bs4 import BeautifulSoup
+# Начало загрузки модуля: отсчет до всех импортов (--startup-report)
+import time
+MODULE_STARTED = time.perf_counter()
+
 import re
 from datetime import datetime
 import threading
-from queue import Queue
+from collections import OrderedDict, Counter, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FuturesTimeout
+from queue import Queue, Empty
 import json
 import os
-from dataclasses import dataclass
+import sqlite3
+import struct
+import socket
+import importlib.util
+from urllib.parse import urlsplit, unquote
+from dataclasses import dataclass, field, asdict
+from array import array
+from bisect import bisect_left
+from functools import lru_cache, partial
 from typing import Optional
 import random
-import time
+from abc import ABC, abstractmethod
+import sys
+import signal
+import argparse
+import statistics
+
+# Длительности этапов запуска, секунд (--startup-report)
+STARTUP_TIMES = OrderedDict()
 
 # Инициализируем генератор случайных чисел с текущим временем
 random.seed(datetime.now().timestamp())
 
-@dataclass
+# Тяжелые библиотеки импортируются при первом использовании: окно
+# появляется сразу, а requests и разборщики загружаются к первому обновлению
+requests = HTTPAdapter = Retry = None
+np = None
+_numpy_checked = False
+
+# tkinter загружается только в графическом режиме (см. load_tk),
+# поэтому сбор данных работает на серверах без дисплея
+tk = ttk = messagebox = scrolledtext = None
+
+def load_tk():
+    """Импорт tkinter для графического интерфейса"""
+    global tk, ttk, messagebox, scrolledtext
+    started = time.perf_counter()
+    import tkinter as tk
+    from tkinter import ttk, messagebox, scrolledtext
+    STARTUP_TIMES.setdefault("import tkinter", time.perf_counter() - started)
+
+def load_http():
+    """Импорт requests для загрузки страниц"""
+    global requests, HTTPAdapter, Retry
+    if requests is None:
+        started = time.perf_counter()
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        STARTUP_TIMES.setdefault("import requests", time.perf_counter() - started)
+    return requests
+
+def load_numpy():
+    """NumPy необязателен: без него статистики считаются на чистом Python"""
+    global np, _numpy_checked
+    if not _numpy_checked:
+        started = time.perf_counter()
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        _numpy_checked = True
+        STARTUP_TIMES.setdefault("import numpy", time.perf_counter() - started)
+    return np
+
+def startup_report() -> str:
+    """Длительности этапов запуска по порядку"""
+    lines = [f"{stage}: {seconds * 1000:.0f} мс" for stage, seconds in STARTUP_TIMES.items()]
+    lines.append(f"всего с загрузки модуля: {(time.perf_counter() - MODULE_STARTED) * 1000:.0f} мс")
+    return "\n".join(lines)
+
+@dataclass(frozen=True, slots=True)
 class WeatherData:
-    """Класс для хранения данных о погоде"""
+    """Класс для хранения данных о погоде (неизменяемый, без __dict__)"""
     source: str
     temperature: float
     feels_like: Optional[float] = None
@@ -27,633 +92,3256 @@ class WeatherData:
     wind_speed: Optional[float] = None
     description: Optional[str] = None
     timestamp: Optional[str] = None
+    observed_at: Optional[float] = None    # время измерения, секунды эпохи
+    
+    @staticmethod
+    def now() -> dict:
+        """Поля времени для нового измерения"""
+        observed_at = time.time()
+        return {
+            "timestamp": datetime.fromtimestamp(observed_at).strftime("%H:%M:%S"),
+            "observed_at": observed_at
+        }
 
-class WeatherScraper:
-    """Класс для парсинга данных о погоде с различных сайтов"""
+AVERAGE_METRICS = ['temperature', 'feels_like', 'humidity', 'pressure', 'wind_speed']
+
+class WeatherBatch:
+    """Столбцовое хранилище показаний для пакетов и истории.
     
-    HEADERS = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-        'Referer': 'https://www.google.com/'
-    }
+    Каждая метрика - массив double (NaN вместо None), время - секунды эпохи,
+    названия источников и описания заменены небольшими целыми номерами.
+    Одно показание занимает около 50 байт вместо сотен у объекта.
+    """
     
-    @staticmethod
-    def get_safe_float(text: str) -> Optional[float]:
-        """Безопасное извлечение числа с плавающей точкой из текста"""
-        if not text:
-            return None
-        text = text.strip().replace('−', '-').replace('+', '').replace(',', '.')
-        match = re.search(r'-?\d+(\.\d+)?', text)
-        return float(match.group()) if match else None
+    METRICS = tuple(AVERAGE_METRICS)
+    INT_METRICS = ('humidity', 'pressure')
     
-    @staticmethod
-    def get_safe_int(text: str) -> Optional[int]:
-        """Безопасное извлечение целого числа из текста"""
-        if not text:
-            return None
-        text = text.strip().replace('−', '-').replace('+', '')
-        match = re.search(r'-?\d+', text)
-        return int(match.group()) if match else None
+    # Общие для всех пакетов таблицы строк: номер -> строка
+    _strings = []
+    _string_ids = {}
+    _intern_lock = threading.Lock()
     
-    # =========== 1. GISMETEO (ОБНОВЛЕННЫЙ) ===========
-    @staticmethod
-    def parse_gismeteo(city: str = "Москва") -> Optional[WeatherData]:
-        """Парсинг данных с Gismeteo.ru - реальный парсинг"""
+    def __init__(self, records=()):
+        self.columns = {metric: array('d') for metric in self.METRICS}
+        self.observed_at = array('d')
+        self.source_ids = array('I')
+        self.description_ids = array('I')
+        self.extend(records)
+    
+    @classmethod
+    def intern(cls, text: Optional[str]) -> int:
+        """Номер строки в общей таблице; 0 - отсутствующее значение"""
+        if text is None:
+            return 0
+        string_id = cls._string_ids.get(text)
+        if string_id is None:
+            with cls._intern_lock:
+                string_id = cls._string_ids.get(text)
+                if string_id is None:
+                    cls._strings.append(text)
+                    string_id = cls._string_ids[text] = len(cls._strings)
+        return string_id
+    
+    @classmethod
+    def string(cls, string_id: int) -> Optional[str]:
+        return cls._strings[string_id - 1] if string_id else None
+    
+    def append(self, data: WeatherData):
+        for metric in self.METRICS:
+            value = getattr(data, metric)
+            self.columns[metric].append(float('nan') if value is None else value)
+        self.observed_at.append(data.observed_at if data.observed_at is not None else float('nan'))
+        self.source_ids.append(self.intern(data.source))
+        self.description_ids.append(self.intern(data.description))
+    
+    def extend(self, records):
+        for data in records:
+            self.append(data)
+    
+    def __len__(self) -> int:
+        return len(self.source_ids)
+    
+    def __getitem__(self, index: int) -> WeatherData:
+        """Восстановление отдельного WeatherData из столбцов"""
+        values = {}
+        for metric in self.METRICS:
+            value = self.columns[metric][index]
+            if value != value:
+                value = None
+            elif metric in self.INT_METRICS:
+                value = int(value)
+            values[metric] = value
+        observed_at = self.observed_at[index]
+        if observed_at != observed_at:
+            observed_at = None
+        return WeatherData(
+            source=self.string(self.source_ids[index]),
+            description=self.string(self.description_ids[index]),
+            timestamp=(datetime.fromtimestamp(observed_at).strftime("%H:%M:%S")
+                       if observed_at is not None else None),
+            observed_at=observed_at,
+            **values
+        )
+    
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+    
+    def sources(self) -> list:
+        return [self.string(source_id) for source_id in self.source_ids]
+    
+    def column(self, metric: str):
+        """Столбец метрики; с NumPy - массив без копирования данных"""
+        if load_numpy() is not None:
+            return np.frombuffer(self.columns[metric], dtype=np.float64)
+        return self.columns[metric]
+    
+    def to_bytes(self) -> bytes:
+        """Компактная запись: своя таблица строк и столбцы массивов как есть"""
+        local_ids = {}
+        strings = []
+        
+        def local_id(string_id):
+            if not string_id:
+                return 0
+            if string_id not in local_ids:
+                strings.append(self.string(string_id))
+                local_ids[string_id] = len(strings)
+            return local_ids[string_id]
+        
+        sources = array('I', (local_id(string_id) for string_id in self.source_ids))
+        descriptions = array('I', (local_id(string_id) for string_id in self.description_ids))
+        text = '\0'.join(strings).encode('utf-8')
+        parts = [struct.pack('<III', len(self), len(strings), len(text)), text]
+        parts.extend(self.columns[metric].tobytes() for metric in self.METRICS)
+        parts.extend((self.observed_at.tobytes(), sources.tobytes(), descriptions.tobytes()))
+        return b''.join(parts)
+    
+    @classmethod
+    def from_bytes(cls, data, offset: int = 0) -> tuple:
+        """Пакет из to_bytes; возвращает (пакет, смещение после него)"""
+        count, string_count, text_size = struct.unpack_from('<III', data, offset)
+        offset += 12
+        text = bytes(data[offset:offset + text_size]).decode('utf-8')
+        offset += text_size
+        ids = [0] + [cls.intern(string) for string in text.split('\0')] if string_count else [0]
+        
+        def read(typecode: str) -> array:
+            nonlocal offset
+            column = array(typecode)
+            size = column.itemsize * count
+            if offset + size > len(data):
+                raise ValueError("Пакет обрезан")
+            column.frombytes(data[offset:offset + size])
+            offset += size
+            return column
+        
+        batch = cls()
+        for metric in cls.METRICS:
+            batch.columns[metric] = read('d')
+        batch.observed_at = read('d')
+        batch.source_ids = array('I', (ids[i] for i in read('I')))
+        batch.description_ids = array('I', (ids[i] for i in read('I')))
+        return batch, offset
+    
+    def matrix(self):
+        """Показания x метрики одним массивом NumPy (требует NumPy)"""
+        load_numpy()
+        return np.column_stack([self.column(metric) for metric in self.METRICS]) \
+            if len(self) else np.empty((0, len(self.METRICS)))
+
+@dataclass
+class CachedPage:
+    """Сохраненный ответ сайта с данными для повторной проверки"""
+    content: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    stored_at: float
+    ttl: float
+    partial: bool = False                     # только начало: загрузка остановлена досрочно
+    
+    def is_fresh(self, now: float) -> bool:
+        return now - self.stored_at < self.ttl
+
+class ResponseCache:
+    """LRU-кэш загруженных страниц с ограничением общего размера в байтах"""
+    
+    def __init__(self, max_bytes: int = 20 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, url: str) -> Optional[CachedPage]:
+        with self._lock:
+            page = self._pages.get(url)
+            if page is not None:
+                self._pages.move_to_end(url)
+            return page
+    
+    def put(self, url: str, page: CachedPage):
+        size = len(page.content)
+        with self._lock:
+            old = self._pages.pop(url, None)
+            if old is not None:
+                self.size_bytes -= len(old.content)
+            if size > self.max_bytes:
+                return
+            self._pages[url] = page
+            self.size_bytes += size
+            # Вытесняем давно не использованные страницы
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._pages.popitem(last=False)
+                self.size_bytes -= len(evicted.content)
+    
+    def revalidated(self, url: str, now: float):
+        """Продление срока жизни страницы после ответа 304"""
+        with self._lock:
+            page = self._pages.get(url)
+            if page is not None:
+                page.stored_at = now
+                self._pages.move_to_end(url)
+    
+    def expire(self):
+        """Все страницы становятся устаревшими и будут перепроверены"""
+        with self._lock:
+            for page in self._pages.values():
+                page.stored_at = float('-inf')
+    
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self.size_bytes = 0
+
+class HtmlBackend(ABC):
+    """Базовый класс разборщика HTML; подклассы оборачивают конкретные библиотеки"""
+    
+    name = ""
+    
+    @abstractmethod
+    def parse(self, content: bytes):
+        ...
+    
+    @abstractmethod
+    def select(self, root, selector: str) -> list:
+        """Узлы по CSS-селектору в порядке документа - поиском самой библиотеки"""
+    
+    @abstractmethod
+    def node_text(self, node, strip: bool = False) -> str:
+        ...
+    
+    @abstractmethod
+    def node_attr(self, node, name: str) -> Optional[str]:
+        ...
+    
+    def page_text(self, root) -> str:
+        return self.node_text(root)
+
+class SoupBackend(HtmlBackend):
+    """BeautifulSoup с парсером lxml или встроенным html.parser"""
+    
+    def __init__(self, features: str = 'html.parser'):
+        started = time.perf_counter()
+        from bs4 import BeautifulSoup
+        STARTUP_TIMES.setdefault("import bs4", time.perf_counter() - started)
+        self.name = features
+        self.features = features
+        self._soup = BeautifulSoup
+    
+    def parse(self, content: bytes):
+        return self._soup(content, self.features)
+    
+    def select(self, root, selector: str) -> list:
+        return root.select(selector)
+    
+    def node_text(self, node, strip: bool = False) -> str:
+        return node.get_text(strip=strip)
+    
+    def node_attr(self, node, name: str) -> Optional[str]:
+        return node.get(name)
+
+class SelectolaxBackend(HtmlBackend):
+    """Быстрый разборщик selectolax на движке lexbor"""
+    
+    name = 'selectolax'
+    # Содержимое этих тегов не входит в текст страницы, как в BeautifulSoup.get_text()
+    NON_TEXT_TAGS = ('script', 'style', 'template')
+    NON_TEXT_SELECTOR = ', '.join(NON_TEXT_TAGS)
+    
+    def __init__(self):
+        started = time.perf_counter()
+        from selectolax.lexbor import LexborHTMLParser
+        STARTUP_TIMES.setdefault("import selectolax", time.perf_counter() - started)
+        self._parser = LexborHTMLParser
+    
+    def parse(self, content: bytes):
+        return self._parser(content)
+    
+    def select(self, root, selector: str) -> list:
+        if root.root is None:
+            return []
+        return root.css(selector)
+    
+    def node_text(self, node, strip: bool = False) -> str:
+        # Поиск lexbor включает сам узел; собственный текст скрипта нужен для JSON-LD
+        if node.tag in self.NON_TEXT_TAGS or node.css_first(self.NON_TEXT_SELECTOR) is None:
+            return node.text(deep=True, separator='', strip=strip)
+        # Редкий случай: скрипт внутри элемента - текстовые узлы собираются вручную
+        parts = (child.text_content or '' for child in node.traverse(include_text=True)
+                 if child.tag == '-text' and child.parent.tag not in self.NON_TEXT_TAGS)
+        return ''.join(part.strip() for part in parts) if strip else ''.join(parts)
+    
+    def node_attr(self, node, name: str) -> Optional[str]:
+        return node.attributes.get(name)
+    
+    def page_text(self, root) -> str:
+        if root.root is None:
+            return ''
+        # Индекс страницы ссылается на узлы исходного дерева - теги удаляются из копии
+        tree = root.clone()
+        tree.strip_tags(list(self.NON_TEXT_TAGS))
+        return tree.text(deep=True, separator='', strip=False)
+
+class PageNode:
+    """Элемент страницы с интерфейсом, общим для всех разборщиков"""
+    
+    __slots__ = ('node', 'backend')
+    
+    def __init__(self, node, backend: HtmlBackend):
+        self.node = node
+        self.backend = backend
+    
+    def get_text(self, strip: bool = False) -> str:
+        return self.backend.node_text(self.node, strip)
+    
+    def get(self, name: str, default=None):
+        value = self.backend.node_attr(self.node, name)
+        return default if value is None else value
+    
+    @property
+    def string(self) -> str:
+        return self.backend.node_text(self.node)
+
+# Фабрики разборщиков по имени, от самого быстрого к самому медленному
+HTML_BACKENDS = OrderedDict([
+    ('selectolax', ('selectolax', SelectolaxBackend)),
+    ('lxml', ('lxml', lambda: SoupBackend('lxml'))),
+    ('html.parser', (None, lambda: SoupBackend('html.parser')))
+])
+
+_backend_instances = {}
+
+def get_html_backend(name: str = 'auto') -> HtmlBackend:
+    """Разборщик по имени; если библиотека не установлена - следующий по скорости.
+    
+    'auto' выбирает самый быстрый из установленных, html.parser доступен всегда.
+    """
+    names = list(HTML_BACKENDS)
+    candidates = names if name == 'auto' or name not in HTML_BACKENDS else names[names.index(name):]
+    for candidate in candidates:
+        instance = _backend_instances.get(candidate)
+        if instance is not None:
+            return instance
+        module, factory = HTML_BACKENDS[candidate]
+        if module is not None and importlib.util.find_spec(module) is None:
+            continue
         try:
-            # Используем разные URL для разных городов
-            city_urls = {
-                "москва": "https://www.gismeteo.ru/weather-moscow-4368/",
-                "санкт-петербург": "https://www.gismeteo.ru/weather-sankt-peterburg-4079/",
-                "новосибирск": "https://www.gismeteo.ru/weather-novosibirsk-4690/",
-                "екатеринбург": "https://www.gismeteo.ru/weather-yekaterinburg-4517/",
-                "казань": "https://www.gismeteo.ru/weather-kazan-4364/"
-            }
-            
-            city_lower = city.lower()
-            url = city_urls.get(city_lower, city_urls["москва"])
-            
-            response = requests.get(url, headers=WeatherScraper.HEADERS, timeout=10)
-            
-            if response.status_code != 200:
-                return None
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Способ 1: Ищем температуру в JSON-LD данных (самый надежный)
-            temperature = None
-            json_ld = soup.find('script', type='application/ld+json')
-            if json_ld:
-                try:
-                    import json as json_module
-                    data = json_module.loads(json_ld.string)
-                    if isinstance(data, dict) and 'mainEntity' in data:
-                        for entity in data['mainEntity']:
-                            if 'name' in entity and 'temperature' in entity.get('name', '').lower():
-                                temp_text = entity['name']
-                                temp_match = re.search(r'(-?\d+)', temp_text)
-                                if temp_match:
-                                    temperature = float(temp_match.group(1))
-                                    break
-                except:
-                    pass
-            
-            # Способ 2: Ищем в мета-тегах
-            if temperature is None:
-                meta_temp = soup.find('meta', {'property': 'og:title'})
-                if meta_temp:
-                    content = meta_temp.get('content', '')
-                    temp_match = re.search(r'(-?\d+)°', content)
-                    if temp_match:
-                        temperature = float(temp_match.group(1))
-            
-            # Способ 3: Ищем в тексте страницы
-            if temperature is None:
-                page_text = soup.get_text()
-                # Ищем паттерны типа "+3°" или "-5°"
-                temp_match = re.search(r'([+-]?\d+)\s*°', page_text)
-                if temp_match:
-                    temp_val = float(temp_match.group(1))
-                    # Проверяем что это разумная температура
-                    if -50 < temp_val < 50:
-                        temperature = temp_val
-            
-            # Если не нашли температуру, генерируем на основе города и времени года
-            if temperature is None:
-                # Генерация температуры на основе города и времени года
-                base_temps = {
-                    "москва": random.uniform(-5, 2),
-                    "санкт-петербург": random.uniform(-3, 3),
-                    "новосибирск": random.uniform(-10, -3),
-                    "екатеринбург": random.uniform(-8, -1),
-                    "казань": random.uniform(-6, 0)
-                }
-                temperature = round(base_temps.get(city_lower, random.uniform(-10, 5)), 1)
-            
-            # Ощущаемая температура (немного ниже реальной)
-            feels_like = round(temperature - random.uniform(0.5, 3.5), 1)
-            
-            # Влажность - ищем на странице
-            humidity = None
-            humidity_patterns = [r'влажность\s*(\d+)%', r'humidity\s*(\d+)%', r'влаж\s*(\d+)']
-            page_text_lower = soup.get_text().lower()
-            
-            for pattern in humidity_patterns:
-                match = re.search(pattern, page_text_lower)
-                if match:
-                    humidity = int(match.group(1))
-                    break
-            
-            if humidity is None:
-                humidity = random.randint(65, 90)
-            
-            # Давление
-            pressure = None
-            pressure_patterns = [r'давление\s*(\d+)', r'pressure\s*(\d+)', r'давл\s*(\d{3})']
-            
-            for pattern in pressure_patterns:
-                match = re.search(pattern, page_text_lower)
-                if match:
-                    pressure = int(match.group(1))
-                    break
-            
-            if pressure is None:
-                pressure = random.randint(735, 765)
-            
-            # Ветер
-            wind_speed = None
-            wind_patterns = [r'ветер\s*(\d+\.?\d*)\s*м/с', r'wind\s*(\d+\.?\d*)\s*m/s']
-            
-            for pattern in wind_patterns:
-                match = re.search(pattern, page_text_lower)
+            instance = factory()
+        except ImportError:
+            # Установлена несовместимая версия библиотеки
+            continue
+        _backend_instances[candidate] = instance
+        return instance
+    raise RuntimeError("Нет доступного разборщика HTML")
+
+_HEAD_END_RE = re.compile(rb'</head\s*>', re.IGNORECASE)
+
+class PageSnapshot:
+    """Разобранная страница: текст и результаты селекторов вычисляются один раз.
+    
+    Все парсеры источника работают с одним снимком вместо повторных
+    проходов soup.get_text() по всему дереву; элементы ищет CSS-движок
+    разборщика, и обертки PageNode создаются только для найденных.
+    Разборщик выбирается для каждого источника, а страница разбирается лениво.
+    """
+    
+    # Шаблоны метрик по приоритету; все они объединяются в одно выражение
+    METRIC_PATTERNS = {
+        'humidity': [r'влажность\s*(\d+)%', r'humidity\s*(\d+)%', r'влаж\s*(\d+)'],
+        'pressure': [r'давление\s*(\d+)', r'pressure\s*(\d+)', r'давл\s*(\d{3})'],
+        'wind_speed': [r'ветер\s*(\d+\.?\d*)\s*м/с', r'wind\s*(\d+\.?\d*)\s*m/s']
+    }
+    METRIC_TYPES = {'humidity': int, 'pressure': int, 'wind_speed': float}
+    
+    # Первое слово приоритетного шаблона и законченное число после него в HTML
+    METRIC_MARKERS = {
+        metric: (re.compile('(?:{}|{}){}'.format(word[0], word[0].upper(), word[1:]).encode()),
+                 re.compile(rb'\d[^<]*<'))
+        for metric, patterns in METRIC_PATTERNS.items()
+        for word in [re.match(r'[^\W\d_]+', patterns[0]).group()]
+    }
+    
+    METRICS_RE = re.compile('|'.join(
+        re.sub(r'\((?!\?)', f'(?P<{metric}__{i}>', pattern, count=1)
+        for metric, patterns in METRIC_PATTERNS.items()
+        for i, pattern in enumerate(patterns)
+    ))
+    
+    def __init__(self, content: bytes, backend: Optional[HtmlBackend] = None,
+                 head_only: bool = False):
+        self.content = content
+        self.backend = backend or get_html_backend()
+        self.head_only = head_only
+        self._root = None
+        self._head = None
+        self._parse_seconds = 0.0
+        self._text = None
+        self._text_lower = None
+        self._selected = {}
+    
+    @property
+    def root(self):
+        """Дерево документа; разбирается при первом обращении"""
+        if self._root is None:
+            content = self.content
+            if self.head_only:
+                match = _HEAD_END_RE.search(content)
                 if match:
-                    wind_speed = float(match.group(1))
-                    break
-            
-            if wind_speed is None:
-                wind_speed = round(random.uniform(1, 8), 1)
-            
-            # Описание погоды
-            description = None
-            desc_selectors = ['div[class*="description"]', 'span[class*="weather"]', 
-                            'div[class*="weather"]', 'p[class*="desc"]']
-            
-            for selector in desc_selectors:
-                elem = soup.select_one(selector)
-                if elem:
-                    description = elem.get_text(strip=True)[:100]
+                    content = content[:match.end()]
+            started = time.perf_counter()
+            self._root = self.backend.parse(content)
+            self._parse_seconds += time.perf_counter() - started
+        return self._root
+    
+    @property
+    def parse_seconds(self) -> float:
+        """Время разбора страницы вместе с отдельным разбором <head>"""
+        head_seconds = self._head._parse_seconds if self._head is not None else 0.0
+        return self._parse_seconds + head_seconds
+    
+    @property
+    def head(self) -> 'PageSnapshot':
+        """Снимок только блока <head> (JSON-LD, мета-теги) без разбора всей страницы"""
+        if self.head_only or self._root is not None:
+            return self
+        if self._head is None:
+            self._head = PageSnapshot(self.content, self.backend, head_only=True)
+        return self._head
+    
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.backend.page_text(self.root)
+        return self._text
+    
+    @property
+    def text_lower(self) -> str:
+        if self._text_lower is None:
+            self._text_lower = self.text.lower()
+        return self._text_lower
+    
+    def select(self, selector: str) -> list:
+        """Элементы по CSS-селектору; результат запоминается для повторных правил"""
+        elems = self._selected.get(selector)
+        if elems is None:
+            elems = [PageNode(node, self.backend) for node in self.backend.select(self.root, selector)]
+            self._selected[selector] = elems
+        return elems
+    
+    def find_all(self, tag: str, cls: Optional[str] = None) -> list:
+        return self.select(tag if cls is None else f'{tag}.{cls}')
+    
+    def find(self, tag: str, cls: Optional[str] = None):
+        elems = self.find_all(tag, cls)
+        return elems[0] if elems else None
+    
+    def find_class_contains(self, tag: str, fragment: str):
+        """Аналог селектора tag[class*="fragment"]"""
+        elems = self.select(f'{tag}[class*="{fragment}"]')
+        return elems[0] if elems else None
+    
+    def find_attr(self, tag: str, name: str, value: str):
+        elems = self.select(f'{tag}[{name}="{value}"]')
+        return elems[0] if elems else None
+    
+    def extract_metrics(self, first_patterns_only: bool = False) -> dict:
+        """Влажность, давление и ветер за один проход регулярного выражения.
+        
+        first_patterns_only - учитывать только самые приоритетные шаблоны:
+        их первое совпадение уже не изменит продолжение страницы.
+        """
+        found = {}
+        best = {metric: len(patterns) for metric, patterns in self.METRIC_PATTERNS.items()}
+        for match in self.METRICS_RE.finditer(self.text_lower):
+            metric, index = match.lastgroup.split('__')
+            index = int(index)
+            if first_patterns_only and index:
+                continue
+            if index < best[metric]:
+                best[metric] = index
+                found[metric] = self.METRIC_TYPES[metric](match.group(match.lastgroup))
+                # Все метрики найдены самыми приоритетными шаблонами
+                if not any(best.values()):
                     break
-            
-            if description is None:
-                descriptions = ["Облачно", "Пасмурно", "Небольшой снег", 
-                              "Ясно", "Переменная облачность", "Снегопад"]
-                description = random.choice(descriptions)
-            
-            return WeatherData(
-                source="Gismeteo.ru",
-                temperature=temperature,
-                feels_like=feels_like,
-                humidity=humidity,
-                pressure=pressure,
-                wind_speed=wind_speed,
-                description=description,
-                timestamp=datetime.now().strftime("%H:%M:%S")
-            )
-            
-        except Exception as e:
-            print(f"Ошибка Gismeteo: {e}")
+        return found
+
+# =========== Реестр источников и городов ===========
+
+@dataclass(frozen=True)
+class City:
+    """Город: типичный диапазон температуры и части URL для источников"""
+    name: str
+    climate: tuple
+    slugs: dict = field(default_factory=dict)
+
+# Чтобы добавить город, достаточно одной строки здесь
+CITIES = OrderedDict((city.name.lower(), city) for city in [
+    City("Москва", (-5, 1),
+         {"gismeteo": "moscow-4368", "yandex": "moscow", "mail": "moskva"}),
+    City("Санкт-Петербург", (-3, 2),
+         {"gismeteo": "sankt-peterburg-4079", "yandex": "saint-petersburg", "mail": "sankt-peterburg"}),
+    City("Новосибирск", (-11, -4),
+         {"gismeteo": "novosibirsk-4690", "yandex": "novosibirsk", "mail": "novosibirsk"}),
+    City("Екатеринбург", (-9, -2),
+         {"gismeteo": "yekaterinburg-4517", "yandex": "yekaterinburg", "mail": "ekaterinburg"}),
+    City("Казань", (-7, -1),
+         {"gismeteo": "kazan-4364", "yandex": "kazan", "mail": "kazan"})
+])
+
+DEFAULT_CITY = "москва"
+DEFAULT_CLIMATE = (-12, 3)
+
+def get_city(name: str) -> City:
+    """Город по названию; у неизвестного города нет частей URL сайтов"""
+    city = CITIES.get(name.strip().lower())
+    if city is None:
+        city = City(name, DEFAULT_CLIMATE)
+    return city
+
+@lru_cache(maxsize=None)
+def compile_selector(selector: str) -> tuple:
+    """Разбор простого CSS-селектора: tag, tag.class или tag[class*="часть"]"""
+    match = re.fullmatch(r'([\w-]+)(?:\.([\w-]+)|\[class\*=["\']?([^"\'\]]+)["\']?\])?', selector.strip())
+    if not match:
+        raise ValueError(f"Неподдерживаемый селектор: {selector}")
+    return match.groups()
+
+class ExtractRule:
+    """Правило извлечения значения со страницы.
+    
+    kind: 'json_ld' - путь в JSON-LD (mainEntity[].name), 'meta' - мета-тег
+    по property, 'css' - элементы по селектору, 'text' - весь текст страницы.
+    Без pattern возвращается текст элемента, с pattern - число из группы 1.
+    """
+    
+    def __init__(self, kind: str, target: str = '', pattern: Optional[str] = None,
+                 require: Optional[str] = None, limits: Optional[tuple] = None,
+                 first_only: bool = False, max_length: Optional[int] = None):
+        self.kind = kind
+        self.target = target
+        self.pattern = re.compile(pattern) if pattern else None
+        self.require = re.compile(require, re.IGNORECASE | re.DOTALL) if require else None
+        self.limits = limits
+        self.first_only = first_only
+        self.max_length = max_length
+        self.selector = compile_selector(target) if kind == 'css' else None
+        self.markers = self._markers()
+    
+    def _markers(self) -> Optional[tuple]:
+        """Выражения, которые по порядку должны встретиться в исходном HTML,
+        прежде чем правило сможет сработать; None - место значения неизвестно"""
+        if self.kind in ('meta', 'json_ld'):
+            return (_HEAD_END_RE,)
+        if self.kind != 'css':
             return None
+        tag, cls, fragment = self.selector
+        opening = rb'<' + re.escape(tag.encode()) + rb'\b'
+        if cls is not None:
+            opening += rb'[^>]*\bclass\s*=\s*["\']?[^"\'>]*(?<![\w-])' + re.escape(cls.encode()) + rb'(?![\w-])'
+        elif fragment is not None:
+            opening += rb'[^>]*\bclass\s*=\s*["\']?[^"\'>]*' + re.escape(fragment.encode())
+        closing = rb'</' + re.escape(tag.encode()) + rb'\s*>'
+        return (re.compile(opening, re.IGNORECASE), re.compile(closing, re.IGNORECASE))
     
-    # =========== 2. Яндекс.Погода (ОБНОВЛЕННЫЙ) ===========
-    @staticmethod
-    def parse_yandex_weather(city: str = "Москва") -> Optional[WeatherData]:
-        """Парсинг данных с Яндекс.Погоды - реальный парсинг"""
+    def candidates(self, page: PageSnapshot):
+        """Тексты, среди которых ищется значение"""
+        if self.kind == 'text':
+            yield page.text
+        elif self.kind == 'meta':
+            meta = page.head.find_attr('meta', 'property', self.target)
+            if meta:
+                yield meta.get('content', '')
+        elif self.kind == 'json_ld':
+            script = page.head.find_attr('script', 'type', 'application/ld+json')
+            if script:
+                try:
+                    yield from self._json_path(json.loads(script.string), self.target.split('.'))
+                except ValueError:
+                    pass
+        elif self.kind == 'css':
+            elems = page.select(self.target)
+            for elem in elems[:1] if self.first_only else elems:
+                yield elem.get_text(strip=True)
+    
+    @classmethod
+    def _json_path(cls, data, path: list):
+        if not path:
+            if isinstance(data, str):
+                yield data
+            return
+        key, rest = path[0], path[1:]
+        iterate = key.endswith('[]')
+        key = key[:-2] if iterate else key
+        value = data.get(key) if isinstance(data, dict) else None
+        for item in (value if iterate and isinstance(value, list) else [value]):
+            yield from cls._json_path(item, rest)
+    
+    def apply(self, page: PageSnapshot):
+        for text in self.candidates(page):
+            if self.require and not self.require.search(text):
+                continue
+            if self.pattern is None:
+                return text[:self.max_length] if self.max_length else text
+            match = self.pattern.search(text)
+            if not match:
+                continue
+            value = float(match.group(1))
+            if self.limits and not (self.limits[0] < value < self.limits[1]):
+                continue
+            return value
+        return None
+
+@dataclass(frozen=True)
+class SourceSpec:
+    """Описание источника: адрес, правила извлечения и диапазоны для генерации"""
+    name: str
+    priority: int
+    url: Optional[str] = None                 # шаблон с {city} и частями URL города
+    headers: Optional[dict] = None
+    temperature: tuple = ()                   # правила по порядку приоритета
+    description: tuple = ()
+    page_metrics: bool = False                # искать влажность/давление/ветер в тексте
+    parser: str = "auto"                      # разборщик HTML
+    cache_ttl: float = 120                    # время жизни страницы в кэше, секунд
+    early_stop: bool = True                   # прерывать загрузку, когда все поля найдены
+    temp_shift: tuple = (0, 0)                # сдвиг диапазона температуры города
+    feels_delta: tuple = (1, 3)
+    humidity: tuple = (70, 90)
+    pressure: tuple = (740, 760)
+    wind: tuple = (1, 6)
+    descriptions: tuple = ("Облачно", "Пасмурно", "Небольшой снег", "Ясно")
+    
+    # Поля, которые build заполняет случайно, если правила их не нашли;
+    # feels_like всегда оценивается по температуре и подстановкой не считается
+    GENERATED_FIELDS = ('temperature', 'humidity', 'pressure', 'wind_speed', 'description')
+    
+    def url_for(self, city: City) -> Optional[str]:
+        """Адрес страницы города; None, если для города нет нужной части URL"""
         try:
-            city_urls = {
-                "москва": "https://yandex.ru/pogoda/moscow",
-                "санкт-петербург": "https://yandex.ru/pogoda/saint-petersburg",
-                "новосибирск": "https://yandex.ru/pogoda/novosibirsk",
-                "екатеринбург": "https://yandex.ru/pogoda/yekaterinburg",
-                "казань": "https://yandex.ru/pogoda/kazan"
-            }
-            
-            city_lower = city.lower()
-            url = city_urls.get(city_lower, city_urls["москва"])
-            
-            headers = WeatherScraper.HEADERS.copy()
-            headers['Accept'] = 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
-            
-            response = requests.get(url, headers=headers, timeout=10)
-            
-            if response.status_code != 200:
-                return None
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Ищем температуру в div с классом temp
-            temperature = None
-            temp_div = soup.find('div', class_='temp')
-            if temp_div:
-                temp_text = temp_div.get_text(strip=True)
-                temp_match = re.search(r'([+-]?\d+)', temp_text)
-                if temp_match:
-                    temperature = float(temp_match.group(1))
-            
-            # Альтернативный поиск
-            if temperature is None:
-                for span in soup.find_all('span'):
-                    text = span.get_text(strip=True)
-                    if '°' in text and ('+' in text or '-' in text or text[0].isdigit()):
-                        temp_match = re.search(r'([+-]?\d+)', text)
-                        if temp_match:
-                            temp_val = float(temp_match.group(1))
-                            if -50 < temp_val < 50:
-                                temperature = temp_val
-                                break
-            
-            if temperature is None:
-                # Генерация на основе города
-                base_temps = {
-                    "москва": random.uniform(-4, 1),
-                    "санкт-петербург": random.uniform(-2, 2),
-                    "новосибирск": random.uniform(-9, -2),
-                    "екатеринбург": random.uniform(-7, 0),
-                    "казань": random.uniform(-5, 1)
-                }
-                temperature = round(base_temps.get(city_lower, random.uniform(-10, 5)), 1)
-            
-            # Ощущаемая температура
-            feels_like = round(temperature - random.uniform(1, 4), 1)
-            
-            # Ищем другие параметры
-            humidity = random.randint(70, 85)
-            pressure = random.randint(740, 760)
-            wind_speed = round(random.uniform(2, 7), 1)
-            
-            # Описание
-            description = None
-            for div in soup.find_all('div'):
-                if 'condition' in div.get('class', []):
-                    description = div.get_text(strip=True)
-                    break
-            
-            if description is None:
-                descriptions = ["Облачно", "Пасмурно", "Небольшой снег", "Ясно"]
-                description = random.choice(descriptions)
-            
-            return WeatherData(
-                source="Яндекс.Погода",
-                temperature=temperature,
-                feels_like=feels_like,
-                humidity=humidity,
-                pressure=pressure,
-                wind_speed=wind_speed,
-                description=description,
-                timestamp=datetime.now().strftime("%H:%M:%S")
-            )
-            
-        except Exception as e:
-            print(f"Ошибка Яндекс: {e}")
+            return self.url.format(city=city.name.lower(), **city.slugs)
+        except KeyError:
             return None
     
-    # =========== 3. Sinoptik.ua (ОБНОВЛЕННЫЙ) ===========
-    @staticmethod
-    def parse_sinoptik(city: str = "Москва") -> Optional[WeatherData]:
-        """Парсинг данных с Sinoptik.ua"""
-        try:
-            city_urls = {
-                "москва": "https://sinoptik.ua/погода-москва",
-                "санкт-петербург": "https://sinoptik.ua/погода-санкт-петербург",
-                "новосибирск": "https://sinoptik.ua/погода-новосибирск",
-                "екатеринбург": "https://sinoptik.ua/погода-екатеринбург",
-                "казань": "https://sinoptik.ua/погода-казань"
-            }
-            
-            city_lower = city.lower()
-            url = city_urls.get(city_lower, city_urls["москва"])
-            
-            response = requests.get(url, headers=WeatherScraper.HEADERS, timeout=10)
-            
-            if response.status_code != 200:
+    def extract(self, page: PageSnapshot) -> dict:
+        """Значения, найденные на странице по правилам источника"""
+        values = {}
+        for field_name in ('temperature', 'description'):
+            for rule in getattr(self, field_name):
+                value = rule.apply(page)
+                if value is not None:
+                    values[field_name] = value
+                    break
+        if self.page_metrics:
+            values.update(page.extract_metrics())
+        return values
+    
+    def stream_markers(self) -> Optional[list]:
+        """Метки в HTML для полей, которые нужны до досрочной остановки загрузки"""
+        markers = []
+        for field_name in ('temperature', 'description'):
+            rules = getattr(self, field_name)
+            if not rules:
+                continue
+            if rules[0].markers is None:
                 return None
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Температура
-            temperature = None
-            temp_p = soup.find('p', class_='today-temp')
-            if temp_p:
-                temp_text = temp_p.get_text(strip=True)
-                temp_match = re.search(r'([+-]?\d+)', temp_text)
-                if temp_match:
-                    temperature = float(temp_match.group(1))
-            
-            if temperature is None:
-                # Поиск температуры в таблице
-                for td in soup.find_all('td', class_='p1'):
-                    text = td.get_text(strip=True)
-                    if '°' in text:
-                        temp_match = re.search(r'([+-]?\d+)', text)
-                        if temp_match:
-                            temperature = float(temp_match.group(1))
-                            break
-            
-            if temperature is None:
-                base_temps = {
-                    "москва": random.uniform(-6, 0),
-                    "санкт-петербург": random.uniform(-4, 1),
-                    "новосибирск": random.uniform(-11, -4),
-                    "екатеринбург": random.uniform(-9, -2),
-                    "казань": random.uniform(-7, -1)
-                }
-                temperature = round(base_temps.get(city_lower, random.uniform(-12, 3)), 1)
-            
-            # Другие параметры
-            feels_like = round(temperature - random.uniform(1, 3), 1)
-            humidity = random.randint(65, 95)
-            pressure = random.randint(735, 755)
-            wind_speed = round(random.uniform(1, 5), 1)
-            
-            # Описание
-            description = None
-            for div in soup.find_all('div', class_='description'):
-                description = div.get_text(strip=True)[:50]
-                break
-            
-            if description is None:
-                descriptions = ["Облачно", "Пасмурно", "Небольшой снег", "Ясно"]
-                description = random.choice(descriptions)
-            
-            return WeatherData(
-                source="Sinoptik.ua",
-                temperature=temperature,
-                feels_like=feels_like,
-                humidity=humidity,
-                pressure=pressure,
-                wind_speed=wind_speed,
-                description=description,
-                timestamp=datetime.now().strftime("%H:%M:%S")
-            )
-            
-        except Exception as e:
-            print(f"Ошибка Sinoptik: {e}")
-            return None
+            markers.append(rules[0].markers)
+        if self.page_metrics:
+            markers.extend(PageSnapshot.METRIC_MARKERS.values())
+        return markers
     
-    # =========== 4. Pogoda.mail.ru (ОБНОВЛЕННЫЙ) ===========
-    @staticmethod
-    def parse_mail_ru(city: str = "Москва") -> Optional[WeatherData]:
-        """Парсинг данных с Pogoda.mail.ru"""
-        try:
-            city_urls = {
-                "москва": "https://pogoda.mail.ru/prognoz/moskva/",
-                "санкт-петербург": "https://pogoda.mail.ru/prognoz/sankt-peterburg/",
-                "новосибирск": "https://pogoda.mail.ru/prognoz/novosibirsk/",
-                "екатеринбург": "https://pogoda.mail.ru/prognoz/ekaterinburg/",
-                "казань": "https://pogoda.mail.ru/prognoz/kazan/"
-            }
-            
-            city_lower = city.lower()
-            url = city_urls.get(city_lower, city_urls["москва"])
-            
-            response = requests.get(url, headers=WeatherScraper.HEADERS, timeout=10)
-            
-            if response.status_code != 200:
+    def final_values(self, page: PageSnapshot) -> Optional[dict]:
+        """Значения, которые остаток страницы уже не изменит; None - найдено не все.
+        
+        Поле окончательно, только если его дало первое правило: более
+        приоритетное совпадение ниже по странице уже невозможно.
+        """
+        values = {}
+        for field_name in ('temperature', 'description'):
+            rules = getattr(self, field_name)
+            if not rules:
+                continue
+            value = rules[0].apply(page)
+            if value is None:
                 return None
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Температура
-            temperature = None
-            
-            # Ищем в заголовке h1
-            for h1 in soup.find_all('h1'):
-                text = h1.get_text(strip=True)
-                if '°' in text:
-                    temp_match = re.search(r'([+-]?\d+)', text)
-                    if temp_match:
-                        temperature = float(temp_match.group(1))
-                        break
-            
-            if temperature is None:
-                # Ищем в div с температурой
-                for div in soup.find_all('div'):
-                    if 'temp' in div.get('class', []):
-                        text = div.get_text(strip=True)
-                        temp_match = re.search(r'([+-]?\d+)', text)
-                        if temp_match:
-                            temperature = float(temp_match.group(1))
-                            break
-            
-            if temperature is None:
-                base_temps = {
-                    "москва": random.uniform(-3, 2),
-                    "санкт-петербург": random.uniform(-1, 3),
-                    "новосибирск": random.uniform(-10, -3),
-                    "екатеринбург": random.uniform(-8, -1),
-                    "казань": random.uniform(-6, 0)
-                }
-                temperature = round(base_temps.get(city_lower, random.uniform(-10, 5)), 1)
-            
-            # Другие параметры
-            feels_like = round(temperature - random.uniform(0.5, 2.5), 1)
-            humidity = random.randint(60, 80)
-            pressure = random.randint(750, 770)
-            wind_speed = round(random.uniform(2, 8), 1)
-            
-            return WeatherData(
-                source="Pogoda.mail.ru",
-                temperature=temperature,
-                feels_like=feels_like,
-                humidity=humidity,
-                pressure=pressure,
-                wind_speed=wind_speed,
-                description="Погода от Mail.ru",
-                timestamp=datetime.now().strftime("%H:%M:%S")
-            )
-            
-        except Exception as e:
-            print(f"Ошибка Mail.ru: {e}")
-            return None
+            values[field_name] = value
+        if self.page_metrics:
+            found = page.extract_metrics(first_patterns_only=True)
+            if len(found) < len(PageSnapshot.METRIC_PATTERNS):
+                return None
+            values.update(found)
+        return values
     
-    # =========== 5. Meteoinfo.ru ===========
-    @staticmethod
-    def parse_meteoinfo(city: str = "Москва") -> Optional[WeatherData]:
-        """Генерация данных для Meteoinfo.ru"""
-        try:
-            base_temps = {
-                "москва": random.uniform(-7, -1),
-                "санкт-петербург": random.uniform(-5, 0),
-                "новосибирск": random.uniform(-12, -5),
-                "екатеринбург": random.uniform(-10, -3),
-                "казань": random.uniform(-8, -2)
-            }
-            
-            city_lower = city.lower()
-            temperature = round(base_temps.get(city_lower, random.uniform(-15, 5)), 1)
-            
-            return WeatherData(
-                source="Meteoinfo.ru",
-                temperature=temperature,
-                feels_like=round(temperature - random.uniform(1, 3), 1),
-                humidity=random.randint(70, 90),
-                pressure=random.randint(740, 760),
-                wind_speed=round(random.uniform(1, 6), 1),
-                description="Данные метеоцентра",
-                timestamp=datetime.now().strftime("%H:%M:%S")
-            )
-            
-        except Exception as e:
-            print(f"Ошибка Meteoinfo: {e}")
-            return None
+    def build(self, city: City, values: dict) -> WeatherData:
+        """WeatherData из найденных значений; недостающие генерируются"""
+        temperature = values.get('temperature')
+        if temperature is None:
+            low, high = city.climate
+            temperature = round(random.uniform(low + self.temp_shift[0], high + self.temp_shift[1]), 1)
+        
+        humidity = values.get('humidity')
+        pressure = values.get('pressure')
+        wind_speed = values.get('wind_speed')
+        description = values.get('description')
+        
+        return WeatherData(
+            source=self.name,
+            temperature=temperature,
+            feels_like=round(temperature - random.uniform(*self.feels_delta), 1),
+            humidity=humidity if humidity is not None else random.randint(*self.humidity),
+            pressure=pressure if pressure is not None else random.randint(*self.pressure),
+            wind_speed=wind_speed if wind_speed is not None else round(random.uniform(*self.wind), 1),
+            description=description if description is not None else random.choice(self.descriptions),
+            **WeatherData.now()
+        )
+
+class StreamScan:
+    """Проверка уже загруженной части страницы во время чтения ответа.
+    
+    Новые блоки просматриваются регулярными выражениями по байтам: для
+    каждого поля ищутся метки его первого правила (открывающий и
+    закрывающий тег, конец <head>, слово метрики с числом). Когда
+    встретились все метки, начало страницы разбирается один раз; если
+    все поля найдены окончательно, загрузка прекращается, а разобранный
+    снимок используется вместо повторного разбора. Если нет - проверка
+    больше не повторяется, и страница дочитывается как обычно.
+    """
+    
+    # Сколько байт конца прошлого блока просматривается повторно
+    OVERLAP = 1024
+    
+    def __init__(self, spec: SourceSpec, backend: Optional[HtmlBackend] = None):
+        self.spec = spec
+        self.backend = backend
+        self.markers = spec.stream_markers()
+        # Для каждого поля: сколько меток найдено и откуда искать следующую
+        self.progress = [(0, 0)] * len(self.markers or ())
+        self.active = bool(self.markers)
+        self.page = None
+    
+    def __call__(self, content: bytearray) -> Optional[int]:
+        """Длина начала страницы, которой достаточно; None - читать дальше"""
+        if not self.active:
+            return None
+        complete = True
+        for i, markers in enumerate(self.markers):
+            found, start = self.progress[i]
+            while found < len(markers):
+                match = markers[found].search(content, start)
+                if match is None:
+                    start = max(start, len(content) - self.OVERLAP)
+                    break
+                found, start = found + 1, match.end()
+            self.progress[i] = (found, start)
+            complete = complete and found == len(markers)
+        if not complete:
+            return None
+        
+        self.active = False
+        # Разбирается только до последнего закрытого тега: текст не обрезан
+        end = content.rfind(b'>') + 1
+        page = PageSnapshot(bytes(content[:end]), self.backend)
+        if self.spec.final_values(page) is None:
+            return None
+        self.page = page
+        return end
+
+class SourceRegistry:
+    """Реестр источников, упорядоченный по приоритету"""
+    
+    def __init__(self, specs=()):
+        self._specs = {}
+        for spec in specs:
+            self.register(spec)
+    
+    def register(self, spec: SourceSpec) -> SourceSpec:
+        self._specs[spec.name] = spec
+        return spec
+    
+    def get(self, name: str) -> Optional[SourceSpec]:
+        return self._specs.get(name)
+    
+    def __getitem__(self, name: str) -> SourceSpec:
+        return self._specs[name]
+    
+    def __iter__(self):
+        return iter(sorted(self._specs.values(), key=lambda spec: spec.priority))
+    
+    def __len__(self):
+        return len(self._specs)
+
+# Температура вида "+3", "-5" в тексте элемента
+TEMP_PATTERN = r'([+-]?\d+)'
+
+# Все регулярные выражения и селекторы компилируются один раз при загрузке
+SOURCE_REGISTRY = SourceRegistry([
+    SourceSpec(
+        name="Gismeteo.ru",
+        priority=1,
+        url="https://www.gismeteo.ru/weather-{gismeteo}/",
+        temperature=(
+            # JSON-LD и мета-теги лежат в <head>, вся страница для них не разбирается
+            ExtractRule('json_ld', 'mainEntity[].name', r'(-?\d+)', require='temperature'),
+            ExtractRule('meta', 'og:title', r'(-?\d+)°'),
+            ExtractRule('text', pattern=r'([+-]?\d+)\s*°', limits=(-50, 50))
+        ),
+        description=(
+            ExtractRule('css', 'div[class*="description"]', first_only=True, max_length=100),
+            ExtractRule('css', 'span[class*="weather"]', first_only=True, max_length=100),
+            ExtractRule('css', 'div[class*="weather"]', first_only=True, max_length=100),
+            ExtractRule('css', 'p[class*="desc"]', first_only=True, max_length=100)
+        ),
+        page_metrics=True,
+        parser="selectolax",
+        cache_ttl=300,
+        temp_shift=(0, 1),
+        feels_delta=(0.5, 3.5),
+        humidity=(65, 90),
+        pressure=(735, 765),
+        wind=(1, 8),
+        descriptions=("Облачно", "Пасмурно", "Небольшой снег",
+                      "Ясно", "Переменная облачность", "Снегопад")
+    ),
+    SourceSpec(
+        name="Яндекс.Погода",
+        priority=2,
+        url="https://yandex.ru/pogoda/{yandex}",
+        headers={'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'},
+        temperature=(
+            ExtractRule('css', 'div.temp', TEMP_PATTERN, first_only=True),
+            # Первый span с градусами и знаком или цифрой в начале
+            ExtractRule('css', 'span', TEMP_PATTERN, require=r'^(?=.*°)(?:\d|.*[+-])',
+                        limits=(-50, 50))
+        ),
+        description=(ExtractRule('css', 'div.condition', first_only=True),),
+        parser="selectolax",
+        cache_ttl=300,
+        temp_shift=(1, 0),
+        feels_delta=(1, 4),
+        humidity=(70, 85),
+        pressure=(740, 760),
+        wind=(2, 7)
+    ),
+    SourceSpec(
+        name="Sinoptik.ua",
+        priority=3,
+        url="https://sinoptik.ua/погода-{city}",
+        temperature=(
+            ExtractRule('css', 'p.today-temp', TEMP_PATTERN, first_only=True),
+            ExtractRule('css', 'td.p1', TEMP_PATTERN, require='°')
+        ),
+        description=(ExtractRule('css', 'div.description', first_only=True, max_length=50),),
+        parser="selectolax",
+        cache_ttl=600,
+        temp_shift=(-1, -1),
+        feels_delta=(1, 3),
+        humidity=(65, 95),
+        pressure=(735, 755),
+        wind=(1, 5)
+    ),
+    SourceSpec(
+        name="Pogoda.mail.ru",
+        priority=4,
+        url="https://pogoda.mail.ru/prognoz/{mail}/",
+        temperature=(
+            ExtractRule('css', 'h1', TEMP_PATTERN, require='°'),
+            ExtractRule('css', 'div.temp', TEMP_PATTERN)
+        ),
+        parser="selectolax",
+        cache_ttl=600,
+        temp_shift=(2, 1),
+        feels_delta=(0.5, 2.5),
+        humidity=(60, 80),
+        pressure=(750, 770),
+        wind=(2, 8),
+        descriptions=("Погода от Mail.ru",)
+    ),
+    SourceSpec(
+        name="Meteoinfo.ru",
+        priority=5,
+        temp_shift=(-2, -2),
+        feels_delta=(1, 3),
+        humidity=(70, 90),
+        pressure=(740, 760),
+        wind=(1, 6),
+        descriptions=("Данные метеоцентра",)
+    ),
+    SourceSpec(
+        name="Foreca.ru",
+        priority=6,
+        feels_delta=(0.5, 2),
+        humidity=(65, 85),
+        pressure=(745, 765),
+        wind=(2, 7),
+        descriptions=("Международный прогноз",)
+    ),
+    SourceSpec(
+        name="Meteoweb.ru",
+        priority=7,
+        temp_shift=(-1, -1),
+        feels_delta=(1, 4),
+        humidity=(75, 95),
+        pressure=(735, 755),
+        wind=(1, 5),
+        descriptions=("Облачно с прояснениями", "Пасмурно, временами снег",
+                      "Переменная облачность", "Ясно, слабый ветер", "Снег, метель")
+    ),
+    SourceSpec(
+        name="Rp5.ru",
+        priority=8,
+        temp_shift=(-3, -3),
+        feels_delta=(2, 5),
+        humidity=(80, 98),
+        pressure=(730, 750),
+        wind=(3, 9),
+        descriptions=("Архив метеоданных",)
+    ),
+    SourceSpec(
+        name="Weather.com",
+        priority=9,
+        temp_shift=(1, 2),
+        feels_delta=(1, 3),
+        humidity=(60, 80),
+        pressure=(755, 775),
+        wind=(4, 10),
+        descriptions=("International weather",)
+    ),
+    SourceSpec(
+        name="BBC Weather",
+        priority=10,
+        temp_shift=(0, -1),
+        feels_delta=(2, 4),
+        humidity=(70, 90),
+        pressure=(740, 760),
+        wind=(2, 6),
+        descriptions=("BBC Weather forecast",)
+    )
+])
+
+# =========== Метрики источников ===========
+
+class Histogram:
+    """Гистограмма с корзинами в формате Prometheus и окном последних значений"""
+    
+    # Границы корзин по умолчанию, секунд
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    # Последние значения для перцентилей
+    RECENT = 200
+    
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'recent')
+    
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=self.RECENT)
+    
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Перцентиль по последним значениям"""
+        if not self.recent:
+            return None
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(q * len(values)))]
+    
+    def cumulative(self):
+        """Пары (граница, число значений <= границы), последняя - +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+class SourceMetrics:
+    """Счетчики и гистограммы этапов загрузки по источникам.
+    
+    Этапы weather_stage_seconds: ttfb (запрос до заголовков ответа, включая
+    установку соединения), download (чтение тела), parse, extract и total.
+    """
+    
+    HELP = {
+        'weather_fetch_total': ("counter", "Загрузки страниц: fresh/revalidated из кэша, downloaded, http_error"),
+        'weather_scrape_total': ("counter", "Обращения к источникам: success, empty, http_error, error, parse_error, cancelled, no_url"),
+        'weather_fallback_total': ("counter", "Подстановки сгенерированных данных: строки "
+                                              "(generated, error, timeout, circuit_open) и поля (field)"),
+        'weather_circuit_open_total': ("counter", "Отключения источника после ошибок"),
+        'weather_coalesced_total': ("counter", "Обращения, получившие результат уже идущего запроса"),
+        'weather_response_bytes_total': ("counter", "Загружено байт"),
+        'weather_stage_seconds': ("histogram", "Длительность этапов обращения к источнику"),
+        'weather_response_size_bytes': ("histogram", "Размер загруженных страниц"),
+        'weather_early_stop_total': ("counter", "Загрузки, прерванные до конца: complete, size_limit"),
+    }
+    SIZE_BUCKETS = (4096, 16384, 65536, 262144, 1048576, 4194304)
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name: str, value: float, buckets: tuple = Histogram.BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+    
+    def counter(self, name: str, **labels) -> float:
+        """Сумма счетчика по всем значениям меток, не указанных в labels"""
+        with self.lock:
+            return sum(value for (key, key_labels), value in self.counters.items()
+                       if key == name and labels.items() <= dict(key_labels).items())
+    
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self.lock:
+            return self.histograms.get((name, tuple(sorted(labels.items()))))
+    
+    def quantile(self, name: str, q: float, min_count: int = 1, **labels) -> Optional[float]:
+        """Перцентиль гистограммы; None, если значений меньше min_count"""
+        with self.lock:
+            histogram = self.histograms.get((name, tuple(sorted(labels.items()))))
+            if histogram is None or len(histogram.recent) < min_count:
+                return None
+            return histogram.quantile(q)
+    
+    def sources(self) -> list:
+        with self.lock:
+            keys = list(self.counters) + list(self.histograms)
+        return sorted({dict(labels)['source'] for _, labels in keys if 'source' in dict(labels)})
+    
+    def summary(self) -> OrderedDict:
+        """Сводка по источникам для интерфейса"""
+        result = OrderedDict()
+        for source in self.sources():
+            scrapes = self.counter('weather_scrape_total', source=source)
+            stages = {}
+            for stage in ('ttfb', 'download', 'parse', 'extract'):
+                histogram = self.histogram('weather_stage_seconds', source=source, stage=stage)
+                if histogram is not None and histogram.count:
+                    stages[stage] = histogram.sum / histogram.count
+            result[source] = {
+                'requests': int(scrapes),
+                'success_rate': (self.counter('weather_scrape_total', source=source, result='success')
+                                 / scrapes if scrapes else None),
+                'fallbacks': int(self.counter('weather_fallback_total', source=source)
+                                 - self.counter('weather_fallback_total', source=source, reason='field')),
+                'generated_fields': int(self.counter('weather_fallback_total', source=source, reason='field')),
+                'cache_hits': int(self.counter('weather_fetch_total', source=source, result='fresh')
+                                  + self.counter('weather_fetch_total', source=source, result='revalidated')),
+                'bytes': int(self.counter('weather_response_bytes_total', source=source)),
+                'early_stops': int(self.counter('weather_early_stop_total', source=source)),
+                'p50': self.quantile('weather_stage_seconds', 0.5, source=source, stage='total'),
+                'p95': self.quantile('weather_stage_seconds', 0.95, source=source, stage='total'),
+                'stages': stages,
+            }
+        return result
+    
+    @staticmethod
+    def _labels(labels, **extra) -> str:
+        items = list(labels) + list(extra.items())
+        if not items:
+            return ""
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                   for _, value in items)
+        return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + "}"
+    
+    def to_prometheus(self) -> str:
+        """Текстовый формат экспозиции Prometheus"""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h.cumulative()), h.sum, h.count))
+                                for key, h in self.histograms.items())
+        lines = []
+        described = set()
+        
+        def describe(name):
+            if name not in described:
+                described.add(name)
+                kind, text = self.HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+        
+        for (name, labels), value in counters:
+            describe(name)
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), (buckets, total, count) in histograms:
+            describe(name)
+            for bound, cumulative in buckets:
+                le = "+Inf" if bound == float('inf') else str(bound)
+                lines.append(f"{name}_bucket{self._labels(labels, le=le)} {cumulative}")
+            lines.append(f"{name}_sum{self._labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{self._labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+    
+    def write_prometheus(self, path: str):
+        """Запись для textfile-коллектора node_exporter с атомарной заменой файла"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+    
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+class SourceUnavailable(Exception):
+    """Сайт ответил 5xx или 429 - перегружен или недоступен"""
+    
+    def __init__(self, url: str, status: int):
+        super().__init__(f"{url}: HTTP {status}")
+        self.status = status
+
+class SourceHealth:
+    """Автомат отключения источников и таймауты по наблюдаемой задержке.
+    
+    После FAILURE_THRESHOLD ошибок подряд источник отключается (open) на
+    COOLDOWN секунд, затем пропускается один пробный запрос (half-open).
+    Неудачная проба удваивает паузу до MAX_COOLDOWN, удачная - закрывает
+    автомат. Ошибками считаются только сбои сети, ответы 5xx/429 и
+    пропущенный лимит времени обновления. Таймаут чтения - перцентиль
+    TTFB источника с запасом.
+    """
+    
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+    
+    FAILURE_THRESHOLD = 3
+    COOLDOWN = 30.0
+    MAX_COOLDOWN = 600.0
+    
+    # Таймаут чтения: TIMEOUT_FACTOR x p95 TTFB в пределах [MIN_READ_TIMEOUT, READ_TIMEOUT]
+    TIMEOUT_QUANTILE = 0.95
+    TIMEOUT_FACTOR = 3.0
+    MIN_READ_TIMEOUT = 2.0
+    MIN_SAMPLES = 5
+    
+    def __init__(self, metrics: SourceMetrics):
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.states = {}
+    
+    def _state(self, source: str) -> dict:
+        state = self.states.get(source)
+        if state is None:
+            state = self.states[source] = {
+                'state': self.CLOSED, 'failures': 0, 'opened_at': 0.0,
+                'cooldown': self.COOLDOWN, 'probing': False
+            }
+        return state
+    
+    def allow(self, source: str) -> bool:
+        """Можно ли обращаться к источнику; после паузы разрешает одну пробу"""
+        with self.lock:
+            state = self._state(source)
+            if state['state'] == self.CLOSED:
+                return True
+            if state['state'] == self.OPEN and time.monotonic() - state['opened_at'] >= state['cooldown']:
+                state['state'] = self.HALF_OPEN
+                state['probing'] = False
+            if state['state'] == self.HALF_OPEN and not state['probing']:
+                state['probing'] = True
+                return True
+            return False
+    
+    def retry_in(self, source: str) -> float:
+        """Секунд до следующей пробы отключенного источника"""
+        with self.lock:
+            state = self._state(source)
+            return max(0.0, state['opened_at'] + state['cooldown'] - time.monotonic())
+    
+    def record_success(self, source: str):
+        with self.lock:
+            state = self._state(source)
+            state.update(state=self.CLOSED, failures=0, cooldown=self.COOLDOWN, probing=False)
+    
+    def release(self, source: str):
+        """Проба прервана без результата - следующий вызов может пробовать снова"""
+        with self.lock:
+            self._state(source)['probing'] = False
+    
+    def record_failure(self, source: str):
+        with self.lock:
+            state = self._state(source)
+            state['failures'] += 1
+            if state['state'] == self.HALF_OPEN:
+                state['cooldown'] = min(state['cooldown'] * 2, self.MAX_COOLDOWN)
+            elif state['failures'] < self.FAILURE_THRESHOLD:
+                return
+            state.update(state=self.OPEN, opened_at=time.monotonic(), probing=False)
+        self.metrics.inc('weather_circuit_open_total', source=source)
+    
+    def state(self, source: str) -> str:
+        with self.lock:
+            return self._state(source)['state']
+    
+    def timeouts(self, source: str, connect_timeout: float, read_timeout: float) -> tuple:
+        """(connect, read) для запроса к источнику"""
+        ttfb = self.metrics.quantile('weather_stage_seconds', self.TIMEOUT_QUANTILE,
+                                     min_count=self.MIN_SAMPLES, source=source, stage='ttfb')
+        if ttfb is None:
+            return connect_timeout, read_timeout
+        adaptive = max(self.MIN_READ_TIMEOUT, ttfb * self.TIMEOUT_FACTOR)
+        return min(connect_timeout, adaptive), min(read_timeout, adaptive)
+    
+    def reset(self):
+        with self.lock:
+            self.states.clear()
+
+# =========== Отмена обновления ===========
+
+class Cancelled(Exception):
+    """Операция прервана через CancelToken"""
+
+class CancelToken:
+    """Флаг отмены для конвейера обновления.
+    
+    У каждого источника свой дочерний токен, который отменяется вместе с
+    родительским. Обработчики on_cancel вызываются сразу при отмене, чтобы
+    разорвать соединения и не ждать окончания чтения страницы.
+    """
+    
+    def __init__(self, parent: Optional['CancelToken'] = None):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        if parent is not None:
+            parent.on_cancel(self.cancel)
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+    
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+    
+    def on_cancel(self, callback):
+        """Вызов callback при отмене (сразу, если уже отменено); возвращает функцию отписки"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return partial(self._remove, callback)
+        callback()
+        return lambda: None
+    
+    def _remove(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+    
+    def child(self) -> 'CancelToken':
+        return CancelToken(self)
+    
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled()
+
+# =========== Объединение одинаковых запросов ===========
+
+class Flight:
+    """Выполняющийся вызов и его результат для ожидающих"""
+    
+    __slots__ = ('done', 'result', 'error')
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Одновременные вызовы с одним ключом выполняются один раз.
+    
+    Первый вызов делает работу, остальные ждут его завершения и получают
+    тот же результат или то же исключение. Завершенный вызов сразу
+    забывается, так что следующий запрос снова идет за свежими данными.
+    """
+    
+    # Период проверки отмены у ожидающих вызовов, секунд
+    POLL_INTERVAL = 0.05
+    
+    def __init__(self, enabled: bool = True):
+        # enabled=False - каждый вызов выполняет работу сам (нагрузочный прогон)
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.flights = {}
+    
+    def do(self, key, func, cancel: Optional[CancelToken] = None) -> tuple:
+        """(результат, был ли он получен чужим вызовом).
+        
+        Ожидающий вызов с отмененным cancel сразу получает Cancelled. Если
+        отменили выполнявший работу вызов, ожидающие повторяют ее сами.
+        """
+        if not self.enabled:
+            return func(), False
+        while True:
+            with self.lock:
+                flight = self.flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self.flights[key] = Flight()
+            if leader:
+                break
+            
+            while not flight.done.wait(self.POLL_INTERVAL if cancel is not None else None):
+                cancel.raise_if_cancelled()
+            if isinstance(flight.error, Cancelled):
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        
+        try:
+            flight.result = func()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result, False
+
+class WeatherScraper:
+    """Класс для парсинга данных о погоде с различных сайтов"""
+    
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+        'Referer': 'https://www.google.com/'
+    }
+    
+    # Настройки общего пула соединений
+    POOL_CONNECTIONS = 10      # число хостов, для которых хранится пул
+    POOL_MAXSIZE = 4           # соединений на один хост
+    RETRY_TOTAL = 2            # повторов при сетевых ошибках и 429/5xx
+    RETRY_BACKOFF = 0.3        # множитель экспоненциальной паузы между повторами
+    CONNECT_TIMEOUT = 3.05     # таймаут установки соединения, секунд
+    READ_TIMEOUT = 10          # таймаут чтения ответа, секунд
+    HOST_CONCURRENCY = 2       # одновременных запросов к одному сайту
+    
+    _session = None
+    _session_lock = threading.Lock()
+    _host_slots = {}
+    
+    # Время жизни страниц в кэше задается в SourceSpec.cache_ttl (0 - без кэша)
+    DEFAULT_CACHE_TTL = 120
+    
+    # Базовый адрес локального стенда (StandInServer); запросы к сайтам уходят на него
+    URL_OVERRIDE = None
+    
+    cache = ResponseCache()
+    metrics = SourceMetrics()
+    health = SourceHealth(metrics)
+    # Одновременные обращения к одному источнику для одного города
+    inflight = SingleFlight()
+    
+    @classmethod
+    def configure_pool(cls, pool_maxsize: Optional[int] = None, retries: Optional[int] = None,
+                       backoff: Optional[float] = None, connect_timeout: Optional[float] = None,
+                       read_timeout: Optional[float] = None, per_host: Optional[int] = None):
+        """Изменение настроек пула; сессия будет пересоздана при следующем запросе"""
+        if pool_maxsize is not None:
+            cls.POOL_MAXSIZE = pool_maxsize
+        if retries is not None:
+            cls.RETRY_TOTAL = retries
+        if backoff is not None:
+            cls.RETRY_BACKOFF = backoff
+        if connect_timeout is not None:
+            cls.CONNECT_TIMEOUT = connect_timeout
+        if read_timeout is not None:
+            cls.READ_TIMEOUT = read_timeout
+        if per_host is not None:
+            cls.HOST_CONCURRENCY = per_host
+            with cls._session_lock:
+                cls._host_slots = {}
+        cls.close_session()
+    
+    @classmethod
+    def get_session(cls) -> 'requests.Session':
+        """Общая сессия с пулом keep-alive соединений для всех парсеров"""
+        load_http()
+        with cls._session_lock:
+            if cls._session is None:
+                retry = Retry(
+                    total=cls.RETRY_TOTAL,
+                    backoff_factor=cls.RETRY_BACKOFF,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset({'GET'}),
+                    respect_retry_after_header=True,
+                    raise_on_status=False
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=cls.POOL_CONNECTIONS,
+                    pool_maxsize=cls.POOL_MAXSIZE,
+                    max_retries=retry
+                )
+                session = requests.Session()
+                session.headers.update(cls.HEADERS)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                cls._session = session
+            return cls._session
+    
+    @classmethod
+    def close_session(cls):
+        """Закрытие всех соединений пула"""
+        with cls._session_lock:
+            if cls._session is not None:
+                cls._session.close()
+                cls._session = None
+    
+    @classmethod
+    def host_slot(cls, url: str) -> threading.BoundedSemaphore:
+        """Семафор, ограничивающий число одновременных запросов к сайту"""
+        host = urlsplit(url).netloc
+        with cls._session_lock:
+            slot = cls._host_slots.get(host)
+            if slot is None:
+                slot = cls._host_slots[host] = threading.BoundedSemaphore(cls.HOST_CONCURRENCY)
+            return slot
+    
+    @classmethod
+    def request_url(cls, url: str) -> str:
+        """Адрес запроса с учетом подмены сайтов локальным стендом"""
+        if not cls.URL_OVERRIDE:
+            return url
+        return cls.URL_OVERRIDE.rstrip('/') + StandInServer.page_path(url)
+    
+    @classmethod
+    def fetch(cls, url: str, headers: Optional[dict] = None,
+              cache_ttl: Optional[float] = None, source: Optional[str] = None,
+              cancel: Optional[CancelToken] = None, until=None) -> Optional[bytes]:
+        """Загрузка страницы через общий пул и кэш; None, если ответ не 200.
+        
+        Ответы 5xx и 429 (после повторов адаптера) - исключение SourceUnavailable.
+        
+        Свежая страница из кэша отдается без запроса, устаревшая
+        перепроверяется по ETag/Last-Modified. Метрики пишутся с меткой
+        source (по умолчанию - имя сайта). Отмена cancel разрывает
+        соединение и прерывает чтение страницы исключением Cancelled.
+        
+        Тело читается блоками не больше MAX_BODY_BYTES; until(начало
+        страницы) -> длина закрывает соединение, не дочитывая ответ.
+        Недочитанная страница хранится в кэше с отметкой partial и
+        отдается только вызовам с until.
+        """
+        ttl = cls.DEFAULT_CACHE_TTL if cache_ttl is None else cache_ttl
+        source = source or urlsplit(url).netloc
+        metrics = cls.metrics
+        now = time.monotonic()
+        cached = cls.cache.get(url) if ttl > 0 else None
+        # Начало страницы не заменяет ее целиком, а ETag относится ко всей странице
+        if cached is not None and cached.partial and until is None:
+            cached = None
+        
+        if cached is not None and cached.is_fresh(now):
+            metrics.inc('weather_fetch_total', source=source, result='fresh')
+            return cached.content
+        
+        request_headers = dict(headers or {})
+        if cached is not None:
+            if cached.etag:
+                request_headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                request_headers['If-Modified-Since'] = cached.last_modified
+        
+        slot = cls.host_slot(url)
+        cls.acquire_slot(slot, cancel)
+        try:
+            started = time.perf_counter()
+            response = cls.get_session().get(
+                cls.request_url(url),
+                headers=request_headers,
+                timeout=cls.health.timeouts(source, cls.CONNECT_TIMEOUT, cls.READ_TIMEOUT),
+                stream=True
+            )
+            # elapsed - от отправки запроса до разбора заголовков ответа
+            ttfb = response.elapsed.total_seconds()
+            metrics.observe('weather_stage_seconds', ttfb, source=source, stage='ttfb')
+            unwatch = cancel.on_cancel(partial(cls.abort_response, response)) if cancel else None
+            try:
+                if response.status_code != 200:
+                    content = None
+                else:
+                    content, complete = cls.read_body(response, cancel, until, source)
+                    metrics.observe('weather_stage_seconds',
+                                    max(0.0, time.perf_counter() - started - ttfb),
+                                    source=source, stage='download')
+            finally:
+                if unwatch is not None:
+                    unwatch()
+                response.close()
+        finally:
+            slot.release()
+        
+        if response.status_code == 304 and cached is not None:
+            metrics.inc('weather_fetch_total', source=source, result='revalidated')
+            cls.cache.revalidated(url, now)
+            return cached.content
+        
+        if content is None:
+            metrics.inc('weather_fetch_total', source=source, result='http_error')
+            if response.status_code == 429 or response.status_code >= 500:
+                raise SourceUnavailable(url, response.status_code)
+            return None
+        
+        metrics.inc('weather_fetch_total', source=source, result='downloaded')
+        metrics.inc('weather_response_bytes_total', len(content), source=source)
+        metrics.observe('weather_response_size_bytes', len(content),
+                        buckets=SourceMetrics.SIZE_BUCKETS, source=source)
+        
+        if ttl > 0:
+            cls.cache.put(url, CachedPage(
+                content=content,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+                stored_at=now,
+                ttl=ttl,
+                partial=not complete
+            ))
+        return content
+    
+    # Размер блока при потоковом чтении ответа, байт
+    CHUNK_SIZE = 64 * 1024
+    # Больше этого тело ответа не читается, байт
+    MAX_BODY_BYTES = 4 * 1024 * 1024
+    
+    @staticmethod
+    def acquire_slot(slot: threading.BoundedSemaphore, cancel: Optional[CancelToken] = None):
+        """Ожидание очереди к сайту с проверкой отмены"""
+        if cancel is None:
+            slot.acquire()
+            return
+        while not slot.acquire(timeout=SingleFlight.POLL_INTERVAL):
+            cancel.raise_if_cancelled()
+    
+    @classmethod
+    def read_body(cls, response, cancel: Optional[CancelToken] = None,
+                  until=None, source: Optional[str] = None) -> bytes:
+        """Чтение тела блоками; при отмене чтение прерывается.
+        
+        Чтение останавливается на MAX_BODY_BYTES или когда until возвращает
+        длину достаточного начала страницы; недочитанное соединение
+        закрывается при response.close(). Возвращает (тело, прочитано ли
+        оно целиком).
+        """
+        content = bytearray()
+        try:
+            for chunk in response.iter_content(cls.CHUNK_SIZE):
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+                content += chunk
+                if len(content) >= cls.MAX_BODY_BYTES:
+                    del content[cls.MAX_BODY_BYTES:]
+                    cls.metrics.inc('weather_early_stop_total', source=source, reason='size_limit')
+                    return bytes(content), False
+                keep = until(content) if until is not None else None
+                if keep is not None:
+                    del content[keep:]
+                    cls.metrics.inc('weather_early_stop_total', source=source, reason='complete')
+                    return bytes(content), False
+        except Cancelled:
+            raise
+        except Exception as e:
+            # Соединение разорвано отменой из другого потока
+            if cancel is not None and cancel.cancelled:
+                raise Cancelled() from e
+            raise
+        return bytes(content), True
+    
+    @staticmethod
+    def abort_response(response):
+        """Разрыв соединения: shutdown будит поток, ждущий данных из сокета"""
+        sock = getattr(getattr(response.raw, 'connection', None), 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+    
+    @classmethod
+    def make_page(cls, content: bytes, spec: SourceSpec) -> PageSnapshot:
+        """Снимок страницы с разборщиком, выбранным для источника;
+        при отсутствии библиотеки берется следующий по скорости"""
+        return PageSnapshot(content, get_html_backend(spec.parser))
+    
+    @classmethod
+    def scrape(cls, spec: SourceSpec, city: str,
+               cancel: Optional[CancelToken] = None) -> Optional[WeatherData]:
+        """Общий движок: загрузка страницы и применение правил источника.
+        
+        Одновременные вызовы для той же пары (источник, город) получают
+        результат одного выполняющегося запроса. После отмены cancel
+        загрузка и разбор прерываются исключением Cancelled; ошибки загрузки
+        и разбора учитываются в метриках и передаются вызывающему.
+        """
+        data, shared = cls.inflight.do((spec.name, city.strip().lower()),
+                                       partial(cls._scrape, spec, city, cancel), cancel)
+        if shared:
+            cls.metrics.inc('weather_coalesced_total', source=spec.name)
+        return data
+    
+    @staticmethod
+    def is_site_failure(error: Exception) -> bool:
+        """Ошибка сети или перегрузки сайта, а не содержимого страницы"""
+        return isinstance(error, SourceUnavailable) or \
+            (requests is not None and isinstance(error, requests.RequestException))
+    
+    @classmethod
+    def _scrape(cls, spec: SourceSpec, city: str,
+                cancel: Optional[CancelToken] = None) -> Optional[WeatherData]:
+        metrics = cls.metrics
+        started = time.perf_counter()
+        result = 'error'
+        try:
+            city_info = get_city(city)
+            values = {}
+            
+            url = spec.url_for(city_info) if spec.url else None
+            if spec.url and url is None:
+                # Чужая страница выдала бы показания другого города - данные генерируются
+                result = 'no_url'
+                return None
+            
+            if url:
+                scan = StreamScan(spec, get_html_backend(spec.parser)) if spec.early_stop else None
+                content = cls.fetch(url, headers=spec.headers,
+                                    cache_ttl=spec.cache_ttl, source=spec.name,
+                                    cancel=cancel, until=scan)
+                if content is None:
+                    result = 'http_error'
+                    return None
+                # Разбор страницы не начинается, если результат уже не нужен
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+                # При досрочной остановке начало страницы уже разобрано проверкой
+                page = scan.page if scan is not None and scan.page is not None \
+                    else cls.make_page(content, spec)
+                parsed_before = page.parse_seconds
+                extract_started = time.perf_counter()
+                values = spec.extract(page)
+                # Страница разбирается лениво, во время извлечения
+                extract_seconds = time.perf_counter() - extract_started
+                metrics.observe('weather_stage_seconds', page.parse_seconds,
+                                source=spec.name, stage='parse')
+                metrics.observe('weather_stage_seconds',
+                                max(0.0, extract_seconds - (page.parse_seconds - parsed_before)),
+                                source=spec.name, stage='extract')
+            
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            data = spec.build(city_info, values)
+            for field_name in SourceSpec.GENERATED_FIELDS:
+                if values.get(field_name) is None:
+                    metrics.inc('weather_fallback_total', source=spec.name, reason='field', field=field_name)
+            result = 'success' if data else 'empty'
+            return data
+            
+        except Cancelled:
+            result = 'cancelled'
+            raise
+        except Exception as e:
+            # Сбой сети или сервера отличается от ошибки разбора ответившего сайта;
+            # текст ошибки выводит сборщик вместе с подстановкой данных
+            if not cls.is_site_failure(e):
+                result = 'parse_error'
+            raise
+        finally:
+            # Сбой сайта отключает источник; 404 и неразобранная страница - нет
+            if spec.url:
+                if result == 'error':
+                    cls.health.record_failure(spec.name)
+                elif result in ('cancelled', 'no_url'):
+                    cls.health.release(spec.name)
+                else:
+                    cls.health.record_success(spec.name)
+            metrics.inc('weather_scrape_total', source=spec.name, result=result)
+            metrics.observe('weather_stage_seconds', time.perf_counter() - started,
+                            source=spec.name, stage='total')
+    
+    @staticmethod
+    def get_safe_float(text: str) -> Optional[float]:
+        """Безопасное извлечение числа с плавающей точкой из текста"""
+        if not text:
+            return None
+        text = text.strip().replace('−', '-').replace('+', '').replace(',', '.')
+        match = re.search(r'-?\d+(\.\d+)?', text)
+        return float(match.group()) if match else None
+    
+    @staticmethod
+    def get_safe_int(text: str) -> Optional[int]:
+        """Безопасное извлечение целого числа из текста"""
+        if not text:
+            return None
+        text = text.strip().replace('−', '-').replace('+', '')
+        match = re.search(r'-?\d+', text)
+        return int(match.group()) if match else None
+    
+    # =========== Отдельные источники (для совместимости) ===========
+    @staticmethod
+    def parse_gismeteo(city: str = "Москва") -> Optional[WeatherData]:
+        """Данные Gismeteo.ru"""
+        return WeatherScraper.scrape(SOURCE_REGISTRY["Gismeteo.ru"], city)
+    
+    @staticmethod
+    def parse_yandex_weather(city: str = "Москва") -> Optional[WeatherData]:
+        """Данные Яндекс.Погода"""
+        return WeatherScraper.scrape(SOURCE_REGISTRY["Яндекс.Погода"], city)
+    
+    @staticmethod
+    def parse_sinoptik(city: str = "Москва") -> Optional[WeatherData]:
+        """Данные Sinoptik.ua"""
+        return WeatherScraper.scrape(SOURCE_REGISTRY["Sinoptik.ua"], city)
+    
+    @staticmethod
+    def parse_mail_ru(city: str = "Москва") -> Optional[WeatherData]:
+        """Данные Pogoda.mail.ru"""
+        return WeatherScraper.scrape(SOURCE_REGISTRY["Pogoda.mail.ru"], city)
+    
+    @staticmethod
+    def parse_meteoinfo(city: str = "Москва") -> Optional[WeatherData]:
+        """Данные Meteoinfo.ru"""
+        return WeatherScraper.scrape(SOURCE_REGISTRY["Meteoinfo.ru"], city)
+    
+    @staticmethod
+    def parse_foreca(city: str = "Москва") -> Optional[WeatherData]:
+        """Данные Foreca.ru"""
+        return WeatherScraper.scrape(SOURCE_REGISTRY["Foreca.ru"], city)
+    
+    @staticmethod
+    def parse_meteoweb(city: str = "Москва") -> Optional[WeatherData]:
+        """Данные Meteoweb.ru"""
+        return WeatherScraper.scrape(SOURCE_REGISTRY["Meteoweb.ru"], city)
+    
+    @staticmethod
+    def parse_rp5(city: str = "Москва") -> Optional[WeatherData]:
+        """Данные Rp5.ru"""
+        return WeatherScraper.scrape(SOURCE_REGISTRY["Rp5.ru"], city)
+    
+    @staticmethod
+    def parse_weather_com(city: str = "Москва") -> Optional[WeatherData]:
+        """Данные Weather.com"""
+        return WeatherScraper.scrape(SOURCE_REGISTRY["Weather.com"], city)
+    
+    @staticmethod
+    def parse_bbc_weather(city: str = "Москва") -> Optional[WeatherData]:
+        """Данные BBC Weather"""
+        return WeatherScraper.scrape(SOURCE_REGISTRY["BBC Weather"], city)
+
+class WeatherCollector:
+    """Параллельный сбор данных со всех источников"""
+    
+    # Все источники из реестра в порядке приоритета
+    SOURCES = [
+        (spec.name, partial(WeatherScraper.scrape, spec))
+        for spec in SOURCE_REGISTRY
+    ]
+    
+    # Общий лимит времени на одно обновление, секунд
+    DEFAULT_DEADLINE = 15.0
+    # Период проверки отмены при ожидании источников, секунд
+    CANCEL_POLL = 0.1
+    
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or len(self.SOURCES)
+    
+    @staticmethod
+    def generate_fallback(source_name: str, city: str, suffix: str = "(ген.)",
+                          description: str = "Сгенерированные данные") -> WeatherData:
+        """Генерация реалистичных данных, если источник не ответил"""
+        # Диапазон шире обычного для города - источник неизвестен
+        low, high = get_city(city).climate
+        temperature = round(random.uniform(low - 3, high + 1), 1)
+        
+        return WeatherData(
+            source=f"{source_name} {suffix}",
+            temperature=temperature,
+            feels_like=round(temperature - random.uniform(1, 3), 1),
+            humidity=random.randint(70, 90),
+            pressure=random.randint(735, 765),
+            wind_speed=round(random.uniform(1, 6), 1),
+            description=description,
+            **WeatherData.now()
+        )
+    
+    def collect(self, city: str, emit, deadline: Optional[float] = None,
+                cancel: Optional[CancelToken] = None) -> list:
+        """Одновременный запуск всех источников.
+        
+        Каждый результат сразу передается в emit в виде сообщения очереди
+        ("log", ...) или ("data", ...). Источники, не успевшие за deadline
+        секунд, заменяются сгенерированными данными.
+        """
+        deadline = self.DEFAULT_DEADLINE if deadline is None else deadline
+        return self.collect_many([city], emit, deadline=deadline, cancel=cancel)[city]
+    
+    def collect_many(self, cities: list, emit=None, deadline: Optional[float] = None,
+                     max_workers: Optional[int] = None, cancel: Optional[CancelToken] = None) -> dict:
+        """Пакетный сбор: N городов x M источников в общем пуле потоков.
+        
+        Одновременно выполняется не больше max_workers задач, а к одному
+        сайту идет не больше WeatherScraper.HOST_CONCURRENCY запросов.
+        Возвращает словарь город -> список WeatherData. После отмены cancel
+        загрузки всех источников прерываются и выбрасывается Cancelled.
+        """
+        emit = emit or (lambda message: None)
+        cancel = cancel or CancelToken()
+        results = OrderedDict((city, []) for city in cities)
+        # В пакетном режиме в логе указывается город
+        with_city = len(results) > 1
+        
+        executor = ThreadPoolExecutor(max_workers=max_workers or self.max_workers,
+                                      thread_name_prefix="weather-source")
+        futures = {}
+        # У каждого источника свой токен: после сбора оставшиеся загрузки прерываются
+        tokens = []
+        for city in results:
+            prefix = f"[{city}] " if with_city else ""
+            for source_name, parser_func in self.SOURCES:
+                if not WeatherScraper.health.allow(source_name):
+                    results[city].append(self._skip(source_name, city, emit, prefix))
+                    continue
+                emit(("log", f"{prefix}Запрашиваю данные из {source_name}...", "INFO"))
+                token = cancel.child()
+                tokens.append(token)
+                futures[executor.submit(parser_func, city, cancel=token)] = (city, source_name)
+        
+        expires = None if deadline is None else time.monotonic() + deadline
+        try:
+            pending = set(futures)
+            while pending:
+                cancel.raise_if_cancelled()
+                timeout = self.CANCEL_POLL
+                if expires is not None:
+                    timeout = min(timeout, expires - time.monotonic())
+                    if timeout <= 0:
+                        raise FuturesTimeout()
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                # Прерванные отменой источники не подменяются сгенерированными данными
+                cancel.raise_if_cancelled()
+                for future in done:
+                    city, source_name = futures.pop(future)
+                    prefix = f"[{city}] " if with_city else ""
+                    results[city].append(self._resolve(future, city, source_name, emit, prefix))
+        except Cancelled:
+            emit(("log", "Сбор данных отменен", "WARNING"))
+            raise
+        except FuturesTimeout:
+            # Оставшиеся источники не уложились в общий лимит
+            for city, source_name in futures.values():
+                prefix = f"[{city}] " if with_city else ""
+                emit(("log", f"{prefix}{source_name}: нет ответа за {deadline:g} с, "
+                             f"использую сгенерированные данные", "WARNING"))
+                WeatherScraper.metrics.inc('weather_fallback_total', source=source_name, reason='timeout')
+                # Источник, который не успевает к лимиту, так же бесполезен, как недоступный
+                spec = SOURCE_REGISTRY.get(source_name)
+                if spec is not None and spec.url:
+                    WeatherScraper.health.record_failure(source_name)
+                data = self.generate_fallback(source_name, city, "(таймаут)")
+                results[city].append(data)
+                emit(("data", data, "generated"))
+        finally:
+            # Не ждем зависшие запросы - их результат уже не нужен, соединения разрываются
+            for token in tokens:
+                token.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        return results
+    
+    def _skip(self, source_name: str, city: str, emit, prefix: str = "") -> WeatherData:
+        """Источник отключен после ошибок - запрос не выполняется"""
+        retry_in = WeatherScraper.health.retry_in(source_name)
+        emit(("log", f"{prefix}{source_name}: отключен после повторных ошибок, "
+                     f"проверка через {retry_in:.0f} с; использую сгенерированные данные", "WARNING"))
+        WeatherScraper.metrics.inc('weather_fallback_total', source=source_name, reason='circuit_open')
+        data = self.generate_fallback(source_name, city, "(отключен)")
+        emit(("data", data, "generated"))
+        return data
+    
+    def _resolve(self, future, city: str, source_name: str, emit, prefix: str = "") -> WeatherData:
+        """Результат источника или сгенерированные данные вместо него"""
+        try:
+            data = future.result()
+        except Exception as e:
+            emit(("log", f"{prefix}Ошибка {source_name}: {str(e)[:50]}", "ERROR"))
+            WeatherScraper.metrics.inc('weather_fallback_total', source=source_name, reason='error')
+            data = self.generate_fallback(source_name, city, "(ошибка)",
+                                          "Данные после ошибки")
+            emit(("data", data, "error"))
+            return data
+        
+        if data:
+            emit(("data", data, "success"))
+            emit(("log", f"{prefix}Данные из {source_name} получены", "SUCCESS"))
+        else:
+            # Если парсинг не удался, генерируем данные
+            emit(("log", f"{prefix}{source_name}: Использую сгенерированные данные", "WARNING"))
+            WeatherScraper.metrics.inc('weather_fallback_total', source=source_name, reason='generated')
+            data = self.generate_fallback(source_name, city)
+            emit(("data", data, "generated"))
+        return data
+
+# =========== Расчет средних значений ===========
+
+# Метрики, которые показываются с одним знаком после запятой, остальные - целыми
+DECIMAL_METRICS = ('temperature', 'feels_like', 'wind_speed')
+
+# Какая статистика показывается как "среднее значение"; усеченное среднее
+# устойчиво к выбросам и не зависит от еще не откалиброванных весов
+AVERAGE_METHOD = "trimmed_mean"
+
+def round_metric(metric: str, value: float):
+    return round(value, 1) if metric in DECIMAL_METRICS else round(value)
+
+class MetricAggregator:
+    """Столбцовый расчет статистик по метрикам.
+    
+    За один проход по отсортированному массиву считаются среднее, медиана,
+    усеченное среднее, стандартное отклонение и среднее, взвешенное по
+    точности источников. С NumPy все города пакета обрабатываются одной
+    векторной операцией, без него - на чистом Python.
+    """
+    
+    TRIM = 0.2   # доля значений, отбрасываемых с каждого края для усеченного среднего
+    STATS = ('mean', 'median', 'trimmed_mean', 'std', 'weighted_mean')
+    
+    # Вес строк без оценки точности: источники без адреса и сгенерированные
+    # данные случайны и не должны перевешивать проверенные сайты
+    UNSCORED_WEIGHT = 0.0
+    
+    def __init__(self, weights: Optional[dict] = None):
+        # Вес источника по его исторической точности; без оценок все веса равны
+        self.weights = weights or {}
+    
+    def weight(self, source: str) -> float:
+        if not self.weights:
+            return 1.0
+        return self.weights.get(source, self.UNSCORED_WEIGHT)
+    
+    def summarize(self, weather_data: list) -> dict:
+        """Статистики по одному набору источников: метрика -> {статистика: значение}"""
+        return self.summarize_batch({None: weather_data})[None]
+    
+    def summarize_batch(self, results: dict) -> dict:
+        """Статистики для многих городов сразу: город -> метрика -> статистики"""
+        if load_numpy() is not None:
+            return self._summarize_numpy(results)
+        return {key: self._summarize_python(records) for key, records in results.items()}
+    
+    def _summarize_numpy(self, results: dict) -> dict:
+        keys = list(results)
+        width = max((len(records) for records in results.values()), default=0)
+        if width == 0:
+            return {key: {} for key in keys}
+        # Массив город x источник x метрика, пустые места заполнены NaN
+        values = np.full((len(keys), width, len(AVERAGE_METRICS)), np.nan)
+        weights = np.zeros((len(keys), width))
+        for i, key in enumerate(keys):
+            records = results[key]
+            if isinstance(records, WeatherBatch):
+                # Столбцы пакета копируются целиком, без обхода объектов
+                values[i, :len(records)] = records.matrix()
+                weights[i, :len(records)] = [self.weight(source) for source in records.sources()]
+                continue
+            for j, data in enumerate(records):
+                values[i, j] = [np.nan if getattr(data, m) is None else getattr(data, m)
+                                for m in AVERAGE_METRICS]
+                weights[i, j] = self.weight(data.source)
+        
+        present = ~np.isnan(values)
+        count = present.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            filled = np.where(present, values, 0.0)
+            mean = filled.sum(axis=1) / count
+            std = np.sqrt(np.where(present, (values - mean[:, None, :]) ** 2, 0.0).sum(axis=1) / count)
+            
+            w = np.where(present, weights[:, :, None], 0.0)
+            total_weight = w.sum(axis=1)
+            # Нет ни одной оцененной строки - обычное среднее
+            weighted = np.where(total_weight > 0, (w * filled).sum(axis=1) / total_weight, mean)
+            
+            # NaN при сортировке уходят в конец, первые count значений - реальные
+            ordered = np.sort(values, axis=1)
+            low = np.clip((count - 1) // 2, 0, None)
+            high = np.clip(count // 2, 0, None)
+            median = (np.take_along_axis(ordered, low[:, None, :], axis=1)[:, 0, :] +
+                      np.take_along_axis(ordered, high[:, None, :], axis=1)[:, 0, :]) / 2
+            
+            trim = np.floor(count * self.TRIM).astype(int)
+            position = np.arange(width)[None, :, None]
+            keep = (position >= trim[:, None, :]) & (position < (count - trim)[:, None, :])
+            trimmed = np.where(keep, ordered, 0.0).sum(axis=1) / keep.sum(axis=1)
+        
+        summary = {}
+        for i, key in enumerate(keys):
+            summary[key] = {}
+            for k, metric in enumerate(AVERAGE_METRICS):
+                if count[i, k] == 0:
+                    continue
+                summary[key][metric] = {
+                    'count': int(count[i, k]),
+                    'mean': float(mean[i, k]),
+                    'median': float(median[i, k]),
+                    'trimmed_mean': float(trimmed[i, k]),
+                    'std': float(std[i, k]),
+                    'weighted_mean': float(weighted[i, k])
+                }
+        return summary
+    
+    def _summarize_python(self, weather_data: list) -> dict:
+        summary = {}
+        for metric in AVERAGE_METRICS:
+            pairs = [(getattr(data, metric), self.weight(data.source))
+                     for data in weather_data if getattr(data, metric) is not None]
+            if not pairs:
+                continue
+            values = sorted(value for value, _ in pairs)
+            count = len(values)
+            mean = sum(values) / count
+            trim = int(count * self.TRIM)
+            kept = values[trim:count - trim]
+            total_weight = sum(weight for _, weight in pairs)
+            summary[metric] = {
+                'count': count,
+                'mean': mean,
+                'median': (values[(count - 1) // 2] + values[count // 2]) / 2,
+                'trimmed_mean': sum(kept) / len(kept),
+                'std': (sum((value - mean) ** 2 for value in values) / count) ** 0.5,
+                'weighted_mean': (sum(value * weight for value, weight in pairs) / total_weight
+                                  if total_weight else mean)
+            }
+        return summary
+
+class StreamingAverages:
+    """Та же статистика, что и итоговая, по уже пришедшим источникам.
+    
+    Источников в одном обновлении около десятка, поэтому сводка по
+    полученным строкам пересчитывается целиком и без NumPy: значение
+    на панели не скачет, когда приходит итоговое ("avg", ...).
+    """
+    
+    def __init__(self, weights: Optional[dict] = None):
+        self.reset(weights)
+    
+    def reset(self, weights: Optional[dict] = None):
+        self.aggregator = MetricAggregator(weights)
+        self.rows = []
+    
+    @property
+    def sources(self) -> int:
+        return len(self.rows)
+    
+    def add(self, data: WeatherData):
+        self.rows.append(data)
+    
+    def averages(self) -> dict:
+        return averages_from_summary(self.aggregator._summarize_python(self.rows))
+
+def averages_from_summary(summary: dict, method: str = AVERAGE_METHOD) -> dict:
+    """Округленные значения выбранной статистики для отображения"""
+    averages = {}
+    for metric, stats in summary.items():
+        value = stats[method]
+        if value == value:  # пропускаем NaN
+            averages[metric] = round_metric(metric, value)
+    return averages
+
+def calculate_averages(weather_data: list, weights: Optional[dict] = None) -> dict:
+    """Средние значения метрик по всем источникам"""
+    return averages_from_summary(MetricAggregator(weights).summarize(weather_data))
+
+def source_deviations(weather_data: list, metric: str = 'temperature') -> dict:
+    """Отклонение каждого источника от медианы - мера его точности.
+    
+    Оцениваются только данные, полученные с сайтов: сгенерированные строки
+    ("... (ген.)") и источники без адреса случайны и сдвигали бы медиану.
+    """
+    values = {}
+    for data in weather_data:
+        spec = SOURCE_REGISTRY.get(data.source)
+        if spec is not None and spec.url and getattr(data, metric) is not None:
+            values[data.source] = getattr(data, metric)
+    # Одному источнику не с чем сравнивать себя
+    if len(values) < 2:
+        return {}
+    median = statistics.median(values.values())
+    return {source: abs(value - median) for source, value in values.items()}
+
+# =========== История измерений ===========
+
+HISTORY_FILE = "weather_history.db"
+LEGACY_HISTORY_FILE = "weather_history.json"
+
+class HistoryStore:
+    """История измерений в SQLite в режиме WAL.
+    
+    Каждая запись - одна вставка без перечитывания и перезаписи файла,
+    журнал WAL сохраняет базу целой при сбое посреди записи.
+    """
+    
+    def __init__(self, path: str = HISTORY_FILE, legacy_path: Optional[str] = LEGACY_HISTORY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY,
+                city TEXT NOT NULL,
+                ts REAL NOT NULL,
+                sources_count INTEGER,
+                temperature REAL,
+                feels_like REAL,
+                humidity REAL,
+                pressure REAL,
+                wind_speed REAL
+            );
+            CREATE INDEX IF NOT EXISTS history_city_ts ON history (city, ts);
+            CREATE TABLE IF NOT EXISTS source_accuracy (
+                source TEXT PRIMARY KEY,
+                samples INTEGER NOT NULL,
+                mean_error REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self._conn.commit()
+        if legacy_path:
+            self._import_legacy(legacy_path)
+    
+    def _import_legacy(self, legacy_path: str):
+        """Однократный перенос записей из старого weather_history.json"""
+        if not os.path.exists(legacy_path):
+            return
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone():
+                return
+            try:
+                with open(legacy_path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ошибка при чтении старой истории: {e}", file=sys.stderr)
+                entries = []
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO history (city, ts, sources_count, " + ", ".join(AVERAGE_METRICS) + ") "
+                    "VALUES (?, ?, ?" + ", ?" * len(AVERAGE_METRICS) + ")",
+                    [self._row(entry.get("city", ""),
+                               datetime.fromisoformat(entry["timestamp"]).timestamp(),
+                               entry.get("sources_count"), entry.get("averages") or {})
+                     for entry in entries if "timestamp" in entry]
+                )
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_imported', ?)",
+                                   (datetime.now().isoformat(),))
+    
+    @staticmethod
+    def _row(city: str, ts: float, sources_count: Optional[int], averages: dict) -> tuple:
+        return (city, ts, sources_count) + tuple(averages.get(metric) for metric in AVERAGE_METRICS)
+    
+    def append(self, city: str, sources_count: int, averages: dict, ts: Optional[float] = None):
+        """Добавление одной записи"""
+        row = self._row(city, time.time() if ts is None else ts, sources_count, averages)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO history (city, ts, sources_count, " + ", ".join(AVERAGE_METRICS) + ") "
+                "VALUES (?, ?, ?" + ", ?" * len(AVERAGE_METRICS) + ")",
+                row
+            )
+    
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+    
+    # Окно скользящего среднего ошибки источника
+    ACCURACY_WINDOW = 50
+    
+    def record_accuracy(self, deviations: dict):
+        """Обновление средней ошибки источников (отклонение от медианы)"""
+        with self._lock, self._conn:
+            for source, error in deviations.items():
+                row = self._conn.execute(
+                    "SELECT samples, mean_error FROM source_accuracy WHERE source = ?", (source,)
+                ).fetchone()
+                samples, mean_error = row if row else (0, 0.0)
+                samples += 1
+                mean_error += (error - mean_error) / min(samples, self.ACCURACY_WINDOW)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO source_accuracy (source, samples, mean_error) "
+                    "VALUES (?, ?, ?)", (source, samples, mean_error)
+                )
+    
+    def source_weights(self) -> dict:
+        """Вес источника: чем меньше средняя ошибка, тем больше вес"""
+        rows = self._query("SELECT source, mean_error FROM source_accuracy", ())
+        return {source: 1.0 / (1.0 + mean_error) for source, mean_error in rows}
+    
+    # Все запросы ниже используют индекс (city, ts) и читают только нужные строки
+    
+    # Группировка по местному времени: ключ часа или дня
+    BUCKETS = {
+        'hour': "strftime('%Y-%m-%d %H:00', ts, 'unixepoch', 'localtime')",
+        'day': "date(ts, 'unixepoch', 'localtime')"
+    }
+    
+    def _query(self, sql: str, params: tuple) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+    
+    @staticmethod
+    def _entry(row: tuple) -> dict:
+        city, ts, sources_count, *values = row
+        return {
+            "city": city,
+            "ts": ts,
+            "timestamp": datetime.fromtimestamp(ts).isoformat(),
+            "sources_count": sources_count,
+            "averages": {metric: value for metric, value in zip(AVERAGE_METRICS, values)
+                         if value is not None}
+        }
+    
+    def cities(self) -> list:
+        return [row[0] for row in self._query("SELECT DISTINCT city FROM history ORDER BY city", ())]
+    
+    def range(self, city: str, start: Optional[float] = None, end: Optional[float] = None,
+              limit: Optional[int] = None) -> list:
+        """Записи города за период [start, end) по возрастанию времени"""
+        sql = "SELECT city, ts, sources_count, " + ", ".join(AVERAGE_METRICS) + \
+              " FROM history WHERE city = ? AND ts >= ? AND ts < ? ORDER BY ts"
+        params = (city, float('-inf') if start is None else start,
+                  float('inf') if end is None else end)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (limit,)
+        return [self._entry(row) for row in self._query(sql, params)]
+    
+    def latest(self, city: str, n: int = 1) -> list:
+        """Последние n записей города, новые первыми"""
+        sql = "SELECT city, ts, sources_count, " + ", ".join(AVERAGE_METRICS) + \
+              " FROM history WHERE city = ? ORDER BY ts DESC LIMIT ?"
+        return [self._entry(row) for row in self._query(sql, (city, n))]
+    
+    def aggregate(self, city: str, bucket: str = 'hour', start: Optional[float] = None,
+                  end: Optional[float] = None, metrics: Optional[list] = None) -> list:
+        """Минимум, среднее и максимум метрик по часам или дням"""
+        metrics = metrics or AVERAGE_METRICS
+        unknown = set(metrics) - set(AVERAGE_METRICS)
+        if unknown or bucket not in self.BUCKETS:
+            raise ValueError(f"Неизвестная метрика или интервал: {sorted(unknown) or bucket}")
+        
+        columns = ", ".join(f"MIN({m}), AVG({m}), MAX({m})" for m in metrics)
+        sql = (f"SELECT {self.BUCKETS[bucket]} AS bucket, COUNT(*), MIN(ts), {columns} "
+               "FROM history WHERE city = ? AND ts >= ? AND ts < ? "
+               "GROUP BY bucket ORDER BY MIN(ts)")
+        params = (city, float('-inf') if start is None else start,
+                  float('inf') if end is None else end)
+        
+        result = []
+        for bucket_key, count, first_ts, *values in self._query(sql, params):
+            entry = {"bucket": bucket_key, "count": count, "start": first_ts}
+            for i, metric in enumerate(metrics):
+                low, mean, high = values[3 * i:3 * i + 3]
+                entry[metric] = {"min": low, "mean": mean, "max": high}
+            result.append(entry)
+        return result
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_history_store = None
+_history_lock = threading.Lock()
+
+def get_history_store() -> HistoryStore:
+    """Общее хранилище истории, открывается при первой записи"""
+    global _history_store
+    with _history_lock:
+        if _history_store is None:
+            _history_store = HistoryStore()
+        return _history_store
+
+def save_history_entry(city: str, sources_count: int, averages: dict,
+                       store: Optional[HistoryStore] = None):
+    """Добавление записи в историю"""
+    (store or get_history_store()).append(city, sources_count, averages)
+
+# =========== Снимок последних данных ===========
+
+SNAPSHOT_FILE = "weather_snapshot.bin"
+
+@dataclass(frozen=True, slots=True)
+class CitySnapshot:
+    """Последние данные города: строки таблицы (WeatherData, статус) и средние"""
+    city: str
+    saved_at: float
+    rows: list
+    averages: dict
+    
+    def age(self) -> float:
+        return time.time() - self.saved_at
+
+class SnapshotStore:
+    """Двоичный снимок последних данных по городам для мгновенного запуска.
+    
+    Файл: заголовок, затем для каждого города имя, время сохранения,
+    средние (double, NaN - нет значения), столбцы WeatherBatch и статусы
+    строк. Файл читается целиком за миллисекунды и заменяется атомарно.
+    """
+    
+    MAGIC = b'WSNAP'
+    VERSION = 1
+    STATUSES = ('success', 'generated', 'error')
+    
+    def __init__(self, path: str = SNAPSHOT_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self._entries = None
+    
+    @staticmethod
+    def key(city: str) -> str:
+        return city.strip().lower()
+    
+    def _header(self, count: int) -> bytes:
+        return self.MAGIC + struct.pack('<BcI', self.VERSION, sys.byteorder[0].encode(), count)
+    
+    def _read(self) -> OrderedDict:
+        entries = OrderedDict()
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return entries
+        
+        header_size = len(self._header(0))
+        # Снимок другой версии или с другим порядком байт не читается
+        if data[:header_size - 4] != self._header(0)[:-4]:
+            return entries
+        try:
+            (count,) = struct.unpack_from('<I', data, header_size - 4)
+            offset = header_size
+            for _ in range(count):
+                (name_size,) = struct.unpack_from('<H', data, offset)
+                offset += 2
+                city = data[offset:offset + name_size].decode('utf-8')
+                offset += name_size
+                (saved_at,) = struct.unpack_from('<d', data, offset)
+                offset += 8
+                values = struct.unpack_from(f'<{len(AVERAGE_METRICS)}d', data, offset)
+                offset += 8 * len(AVERAGE_METRICS)
+                batch, offset = WeatherBatch.from_bytes(data, offset)
+                statuses = data[offset:offset + len(batch)]
+                offset += len(batch)
+                averages = {metric: round_metric(metric, value)
+                            for metric, value in zip(AVERAGE_METRICS, values) if value == value}
+                rows = [(weather, self.STATUSES[status] if status < len(self.STATUSES) else 'error')
+                        for weather, status in zip(batch, statuses)]
+                entries[self.key(city)] = CitySnapshot(city, saved_at, rows, averages)
+        except (struct.error, ValueError, IndexError):
+            # Поврежденный снимок равен отсутствующему: данные придут с обновлением
+            return OrderedDict()
+        return entries
+    
+    def _entries_loaded(self) -> OrderedDict:
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+    
+    def get(self, city: str) -> Optional[CitySnapshot]:
+        with self.lock:
+            return self._entries_loaded().get(self.key(city))
+    
+    def save(self, city: str, rows: list, averages: dict):
+        """Замена снимка города и атомарная перезапись файла"""
+        with self.lock:
+            entries = self._entries_loaded()
+            entries[self.key(city)] = CitySnapshot(city, time.time(), list(rows), dict(averages))
+            
+            parts = [self._header(len(entries))]
+            for snapshot in entries.values():
+                name = snapshot.city.encode('utf-8')
+                parts.append(struct.pack('<H', len(name)) + name)
+                parts.append(struct.pack('<d', snapshot.saved_at))
+                parts.append(struct.pack(f'<{len(AVERAGE_METRICS)}d', *(
+                    float(snapshot.averages.get(metric, float('nan'))) for metric in AVERAGE_METRICS)))
+                parts.append(WeatherBatch(data for data, _ in snapshot.rows).to_bytes())
+                parts.append(bytes(self.STATUSES.index(status) if status in self.STATUSES else 2
+                                   for _, status in snapshot.rows))
+            
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(b''.join(parts))
+            os.replace(tmp_path, self.path)
+
+# =========== Журнал операций ===========
+
+LOG_BUFFER_SIZE = 5000
+
+class LogBuffer:
+    """Кольцевой буфер записей журнала с необязательной записью в файл.
+    
+    Хранит не больше maxlen последних записей, поэтому память не растет
+    при многодневной работе; полный журнал при необходимости пишется в файл.
+    """
+    
+    def __init__(self, maxlen: int = LOG_BUFFER_SIZE, sink_path: Optional[str] = None):
+        self.entries = deque(maxlen=max(1, maxlen))
+        self.lock = threading.Lock()
+        self.sink = open(sink_path, "a", encoding="utf-8") if sink_path else None
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    @staticmethod
+    def format_entry(entry: tuple) -> str:
+        timestamp, level, message = entry
+        return f"[{timestamp}] {message}"
+    
+    def extend(self, messages: list) -> list:
+        """Добавление пачки (сообщение, уровень); возвращает новые записи"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        entries = [(timestamp, level, message) for message, level in messages]
+        with self.lock:
+            self.entries.extend(entries)
+            if self.sink is not None:
+                self.sink.writelines(f"{datetime.now().date()} {ts} {level}: {message}\n"
+                                     for ts, level, message in entries)
+                self.sink.flush()
+        return entries
+    
+    def filtered(self, levels=None) -> list:
+        with self.lock:
+            return [entry for entry in self.entries if levels is None or entry[1] in levels]
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+    
+    def close(self):
+        with self.lock:
+            if self.sink is not None:
+                self.sink.close()
+                self.sink = None
+
+# =========== Режим без графического интерфейса ===========
+
+class HeadlessRunner:
+    """Сбор данных по расписанию без Tkinter (для серверов без дисплея)"""
+    
+    def __init__(self, cities: list, interval: float = 0, deadline: Optional[float] = None,
+                 output: str = "stdout", quiet: bool = False, workers: Optional[int] = None,
+                 store: Optional[HistoryStore] = None, log: Optional[LogBuffer] = None,
+                 metrics_file: Optional[str] = None):
+        self.cities = cities
+        self.store = store
+        self.interval = interval
+        self.deadline = deadline
+        self.output = output
+        self.quiet = quiet
+        self.log = log
+        self.metrics_file = metrics_file
+        self.collector = WeatherCollector(max_workers=workers)
+        self.stop_event = threading.Event()
+        self.cancel = CancelToken()
+    
+    def emit(self, message: tuple):
+        """Сообщения сборщика: лог - в stderr, данные собираются в run_once"""
+        if message[0] != "log":
+            return
+        _, text, level = message
+        if self.log is not None:
+            self.log.extend([(text, level)])
+        if not self.quiet:
+            timestamp = datetime.now().strftime("%H:%M:%S")
+            print(f"[{timestamp}] {level}: {text}", file=sys.stderr, flush=True)
+    
+    def write_result(self, city: str, weather_data: list, averages: dict):
+        if self.output in ("stdout", "both"):
+            record = {
+                "city": city,
+                "timestamp": datetime.now().isoformat(),
+                "sources_count": len(weather_data),
+                "sources": [asdict(data) for data in weather_data],
+                "averages": averages
+            }
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+        if self.output in ("history", "both"):
+            save_history_entry(city, len(weather_data), averages, store=self.store)
+    
+    def run_once(self):
+        """Один пакетный проход по всем городам"""
+        self.cancel = CancelToken()
+        if self.stop_event.is_set():
+            return
+        try:
+            results = self.collector.collect_many(self.cities, self.emit, deadline=self.deadline,
+                                                  cancel=self.cancel)
+        except Cancelled:
+            return
+        # С выводом только в stdout база истории не открывается и не создается
+        store = self.store
+        if store is None and self.output != "stdout":
+            store = get_history_store()
+        summaries = MetricAggregator(store.source_weights() if store is not None else None) \
+            .summarize_batch(results)
+        for city, weather_data in results.items():
+            if store is not None:
+                store.record_accuracy(source_deviations(weather_data))
+            self.write_result(city, weather_data, averages_from_summary(summaries[city]))
+        if self.metrics_file:
+            WeatherScraper.metrics.write_prometheus(self.metrics_file)
+    
+    def run(self):
+        """Проход сразу, затем по расписанию каждые interval секунд до остановки"""
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            self.run_once()
+            if self.interval <= 0:
+                break
+            self.stop_event.wait(max(0.0, self.interval - (time.monotonic() - started)))
+    
+    def stop(self, *_):
+        """Остановка по сигналу: текущий проход прерывается сразу"""
+        self.stop_event.set()
+        self.cancel.cancel()
+
+def print_report(args: argparse.Namespace, cities: list) -> int:
+    """Вывод агрегатов истории по часам или дням в формате JSON lines"""
+    store = HistoryStore(args.history_file)
+    start = time.time() - args.since * 3600 if args.since else None
+    for city in cities:
+        for entry in store.aggregate(city, args.report, start=start):
+            print(json.dumps({"city": city, **entry}, ensure_ascii=False))
+    store.close()
+    return 0
+
+def parse_cities(args: argparse.Namespace) -> list:
+    return [city.strip() for city in args.cities.split(',') if city.strip()]
+
+def run_headless(args: argparse.Namespace) -> int:
+    """Запуск сбора данных из командной строки"""
+    cities = parse_cities(args)
+    if args.report:
+        return print_report(args, cities)
+    unknown = [city for city in cities if city.lower() not in CITIES]
+    if unknown:
+        print(f"Нет адресов сайтов для городов: {', '.join(unknown)}; "
+              f"их данные будут сгенерированы", file=sys.stderr)
+    WeatherScraper.configure_pool(pool_maxsize=max(args.per_host, WeatherScraper.POOL_MAXSIZE),
+                                  per_host=args.per_host)
+    runner = HeadlessRunner(
+        cities,
+        interval=args.interval,
+        deadline=args.deadline,
+        output=args.output,
+        quiet=args.quiet,
+        workers=args.workers,
+        store=HistoryStore(args.history_file) if args.output != "stdout" else None,
+        log=LogBuffer(args.log_size, args.log_file) if args.log_file else None,
+        metrics_file=args.metrics_file
+    )
+    
+    # Корректная остановка демона по SIGTERM/SIGINT
+    signal.signal(signal.SIGINT, runner.stop)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, runner.stop)
+    
+    try:
+        runner.run()
+    finally:
+        WeatherScraper.close_session()
+        if runner.log is not None:
+            runner.log.close()
+    if args.startup_report:
+        print(startup_report(), file=sys.stderr)
+    return 0
+
+# =========== Замеры производительности ===========
+
+# Размеры синтетических страниц близки к размерам настоящих, байт
+FIXTURE_SIZES = {
+    "Gismeteo.ru": 450_000,
+    "Яндекс.Погода": 700_000,
+    "Sinoptik.ua": 250_000,
+    "Pogoda.mail.ru": 350_000,
+}
+
+# Разметка, по которой правила источника находят значения: (в <head>, в <body>)
+FIXTURE_MARKUP = {
+    "Gismeteo.ru": (
+        '<meta property="og:title" content="Погода в городе {city}: {temp}°">'
+        '<script type="application/ld+json">{{"mainEntity": [{{"name": "Current temperature {temp}"}}]}}</script>',
+        '<div class="weather-description">{description}</div>'
+        '<div class="now-info">Влажность {humidity}% Давление {pressure} мм Ветер {wind} м/с</div>'
+    ),
+    "Яндекс.Погода": (
+        '',
+        '<div class="temp">{temp}</div><div class="condition">{description}</div>'
+    ),
+    "Sinoptik.ua": (
+        '',
+        '<p class="today-temp">{temp}°C</p><div class="description">{description}</div>'
+    ),
+    "Pogoda.mail.ru": (
+        '',
+        '<h1>Погода в городе {city} {temp}°</h1><div class="temp">{temp}</div>'
+    ),
+}
+
+def fixture_name(source: str) -> str:
+    return re.sub(r'\W+', '_', source.lower()).strip('_') + ".html"
+
+def make_fixture(spec: SourceSpec, city: City, rng: random.Random) -> tuple:
+    """Синтетическая страница источника: (HTML, ожидаемые значения).
+    
+    Значения окружены разметкой-заполнителем до размера настоящей страницы,
+    чтобы разбор занимал столько же времени, сколько на живом сайте.
+    """
+    expected = {
+        'temperature': float(rng.randint(*city.climate)),
+        'description': rng.choice(spec.descriptions),
+        'humidity': rng.randint(*spec.humidity),
+        'pressure': rng.randint(*spec.pressure),
+        'wind_speed': float(rng.randint(*spec.wind)),
+    }
+    head, body = FIXTURE_MARKUP.get(spec.name, ('', ''))
+    values = dict(city=city.name, temp=f"{expected['temperature']:+.0f}",
+                  description=expected['description'], humidity=expected['humidity'],
+                  pressure=expected['pressure'], wind=f"{expected['wind_speed']:g}")
+    
+    filler = []
+    size = 0
+    while size < FIXTURE_SIZES.get(spec.name, 200_000):
+        i = len(filler)
+        if i % 10 == 9:
+            block = (f'<script>window.__state_{i} = {{"id": {i}, "items": '
+                     f'{[rng.randint(0, 10**6) for _ in range(20)]}}};</script>')
+        else:
+            block = (f'<div class="forecast-item item-{i}"><a href="/day/{i}" class="link">'
+                     f'<span class="date">{rng.randint(1, 28)}.{rng.randint(1, 12):02d}</span>'
+                     f'<span class="value">{rng.randint(-30, 30)} град</span></a>'
+                     f'<ul class="details">' + ''.join(
+                         f'<li data-hour="{hour}">{rng.choice(spec.descriptions)}</li>'
+                         for hour in range(0, 24, 3)) + '</ul></div>')
+        filler.append(block)
+        size += len(block.encode('utf-8'))
+    middle = len(filler) // 2
+    
+    page = (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{spec.name}</title>'
+            f'{head.format(**values)}</head><body><div class="page">'
+            + ''.join(filler[:middle]) + body.format(**values) + ''.join(filler[middle:])
+            + '</div></body></html>')
+    # Значения, для которых у источника нет правил, генерируются случайно
+    if not spec.description:
+        expected['description'] = None
+    if not spec.page_metrics:
+        for metric in ('humidity', 'pressure', 'wind_speed'):
+            expected[metric] = None
+    return page.encode('utf-8'), expected
+
+def load_fixtures(args: argparse.Namespace, city: City) -> OrderedDict:
+    """Страницы источников с адресами: сохраненные (--fixtures) или синтетические"""
+    rng = random.Random(args.seed)
+    fixtures = OrderedDict()
+    for spec in SOURCE_REGISTRY:
+        if not spec.url or spec.url_for(city) is None:
+            continue
+        content, expected = make_fixture(spec, city, rng)
+        if args.fixtures:
+            path = os.path.join(args.fixtures, fixture_name(spec.name))
+            if not os.path.exists(path):
+                continue
+            with open(path, 'rb') as f:
+                content = f.read()
+            # Значения на сохраненной странице заранее неизвестны
+            expected = None
+        fixtures[spec.name] = (spec, content, expected)
+    return fixtures
+
+def record_fixtures(args: argparse.Namespace) -> int:
+    """Сохранение живых страниц источников для воспроизводимых замеров"""
+    city = get_city(parse_cities(args)[0])
+    load_http()
+    os.makedirs(args.record, exist_ok=True)
+    failed = 0
+    for spec in SOURCE_REGISTRY:
+        if not spec.url:
+            continue
+        url = spec.url_for(city)
+        if url is None:
+            continue
+        try:
+            content = WeatherScraper.fetch(url, headers=spec.headers, cache_ttl=0, source=spec.name)
+        except (requests.RequestException, SourceUnavailable) as e:
+            content = None
+            print(f"{spec.name}: {e}", file=sys.stderr)
+        if content is None:
+            failed += 1
+            print(f"{spec.name}: страница {url} не загружена", file=sys.stderr)
+            continue
+        path = os.path.join(args.record, fixture_name(spec.name))
+        with open(path, 'wb') as f:
+            f.write(content)
+        print(f"{spec.name}: {len(content)} байт -> {path}", file=sys.stderr)
+    WeatherScraper.close_session()
+    return 1 if failed else 0
+
+@lru_cache(maxsize=None)
+def stand_in_http_classes() -> tuple:
+    """Классы сервера и обработчика стенда; http.server нужен только замерам"""
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    
+    class StandInHTTPServer(ThreadingHTTPServer):
+        """HTTP-сервер стенда; клиент вправе закрыть соединение, не дочитав ответ"""
+        
+        daemon_threads = True
+        
+        def handle_error(self, request, client_address):
+            if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+                return
+            super().handle_error(request, client_address)
+    
+    class StandInHandler(BaseHTTPRequestHandler):
+        """Ответы локального стенда; поведение задает server.stand_in"""
+        
+        protocol_version = "HTTP/1.1"
+        
+        def do_GET(self):
+            status, headers, content = self.server.stand_in.respond(unquote(self.path), self.headers)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    return StandInHTTPServer, StandInHandler
+
+class StandInServer:
+    """Локальный HTTP-сервер вместо сайтов источников.
+    
+    Пока задан WeatherScraper.URL_OVERRIDE = server.url, запрос к
+    https://host/path уходит на http://127.0.0.1:port/host/path.
+    Сервер может имитировать медленные и ненадежные сайты: задержку
+    ответа latency=(от, до) секунд, долю ответов 500/503 error_rate,
+    ограничение throttle запросов в секунду на сайт (сверх него - 429)
+    и ответы 304 на If-None-Match.
+    """
+    
+    def __init__(self, pages: Optional[dict] = None, host: str = "127.0.0.1", port: int = 0,
+                 latency: tuple = (0.0, 0.0), error_rate: float = 0.0, throttle: float = 0,
+                 etag: bool = True, seed: Optional[int] = None, handler=None):
+        self.pages = {}
+        for url, content in (pages or {}).items():
+            self.add_page(url, content)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle = throttle
+        self.etag = etag
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.stats = Counter()
+        server_class, default_handler = stand_in_http_classes()
+        self.httpd = server_class((host, port), handler or default_handler)
+        self.httpd.stand_in = self
+        self.thread = None
+    
+    @staticmethod
+    def page_path(url: str) -> str:
+        parts = urlsplit(url)
+        path = f"/{parts.netloc}{unquote(parts.path) or '/'}"
+        return f"{path}?{parts.query}" if parts.query else path
+    
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def add_page(self, url: str, content: bytes):
+        self.pages[self.page_path(url)] = content
+    
+    def _throttled(self, site: str) -> bool:
+        """Корзина токенов на сайт: throttle запросов в секунду с запасом на одну секунду"""
+        if not self.throttle:
+            return False
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(site, (self.throttle, now))
+        tokens = min(self.throttle, tokens + (now - updated) * self.throttle)
+        if tokens < 1:
+            self.buckets[site] = (tokens, now)
+            return True
+        self.buckets[site] = (tokens - 1, now)
+        return False
+    
+    def respond(self, path: str, headers) -> tuple:
+        """(статус, заголовки, тело) ответа на GET path"""
+        with self.lock:
+            delay = self.rng.uniform(*self.latency)
+            failed = self.rng.random() < self.error_rate
+            throttled = self._throttled(path.split('/', 2)[1])
+        if delay:
+            time.sleep(delay)
+        
+        content = self.pages.get(path)
+        if throttled:
+            status, reply, content = 429, {"Retry-After": "1"}, b""
+        elif content is None:
+            status, reply, content = 404, {}, b""
+        elif failed:
+            status, reply, content = self.rng.choice((500, 503)), {}, b""
+        else:
+            status, reply = 200, {"Content-Type": "text/html; charset=utf-8"}
+            if self.etag:
+                import hashlib
+                etag = '"%s"' % hashlib.md5(content).hexdigest()
+                reply["ETag"] = etag
+                if headers.get("If-None-Match") == etag:
+                    status, content = 304, b""
+        with self.lock:
+            self.stats[status] += 1
+        return status, reply, content
+    
+    def start(self) -> 'StandInServer':
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="stand-in-server",
+                                       daemon=True)
+        self.thread.start()
+        return self
+    
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def __enter__(self) -> 'StandInServer':
+        return self.start()
+    
+    def __exit__(self, *_):
+        self.close()
+
+def percentile(values: list, q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def bench_parse(spec: SourceSpec, content: bytes, iterations: int) -> dict:
+    """Время разбора и извлечения, пропускная способность и память на одну страницу"""
+    WeatherScraper.make_page(content, spec)
+    timings = []
+    values = {}
+    for _ in range(iterations):
+        started = time.perf_counter()
+        values = spec.extract(WeatherScraper.make_page(content, spec))
+        timings.append(time.perf_counter() - started)
+    
+    # tracemalloc видит только память Python, но не буферы lxml/lexbor
+    import tracemalloc
+    tracemalloc.start()
+    spec.extract(WeatherScraper.make_page(content, spec))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    total = sum(timings)
+    return {
+        'bytes': len(content),
+        'parse_p50_ms': statistics.median(timings) * 1000,
+        'parse_p95_ms': percentile(timings, 0.95) * 1000,
+        'pages_per_s': iterations / total if total else None,
+        'mb_per_s': len(content) * iterations / total / 2**20 if total else None,
+        'peak_kb': peak / 1024,
+        'values': values,
+    }
+
+def bench_refresh(fixtures: OrderedDict, city: City, refreshes: int) -> tuple:
+    """Сквозное время: загрузка со стенда, разбор и полный проход сборщика"""
+    per_source = {name: [] for name in fixtures}
+    refresh_times = []
+    with StandInServer({spec.url_for(city): content
+                        for spec, content, _ in fixtures.values()}) as server:
+        WeatherScraper.URL_OVERRIDE = server.url
+        try:
+            for _ in range(refreshes):
+                for name, (spec, _, _) in fixtures.items():
+                    WeatherScraper.cache.clear()
+                    started = time.perf_counter()
+                    WeatherScraper.scrape(spec, city.name)
+                    per_source[name].append(time.perf_counter() - started)
+                WeatherScraper.cache.clear()
+                started = time.perf_counter()
+                WeatherCollector().collect(city.name, lambda message: None)
+                refresh_times.append(time.perf_counter() - started)
+        finally:
+            WeatherScraper.URL_OVERRIDE = None
+            WeatherScraper.close_session()
+    return per_source, refresh_times
+
+def check_fixture_values(values: dict, expected: Optional[dict]) -> list:
+    """Поля, извлеченные не так, как записано в синтетической странице"""
+    if expected is None:
+        return []
+    return [name for name, value in expected.items()
+            if value is not None and values.get(name) != value]
+
+def stand_in_pages(cities: list, seed: int) -> dict:
+    """Синтетические страницы всех источников с адресами для списка городов"""
+    rng = random.Random(seed)
+    return {spec.url_for(city): make_fixture(spec, city, rng)[0]
+            for city in cities for spec in SOURCE_REGISTRY if spec.url and spec.url_for(city)}
+
+def make_stand_in(args: argparse.Namespace, cities: list, port: int = 0) -> StandInServer:
+    return StandInServer(stand_in_pages(cities, args.seed), port=port,
+                         latency=args.mock_latency, error_rate=args.mock_error_rate,
+                         throttle=args.mock_throttle, seed=args.seed)
+
+def serve_stand_in(args: argparse.Namespace) -> int:
+    """Стенд в отдельном процессе; приложение направляется на него через --stand-in"""
+    cities = [get_city(name) for name in parse_cities(args)]
+    server = make_stand_in(args, cities, port=args.mock_port)
+    print(f"Стенд: {server.url} ({len(server.pages)} страниц); запуск приложения: --stand-in {server.url}",
+          file=sys.stderr)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+def run_load(args: argparse.Namespace) -> int:
+    """Нагрузка: load_clients одновременных обновлений по городам, load_rounds раз.
+    
+    Каждое обновление - тот же проход сборщика, что и в окне приложения.
+    Между раундами кэш устаревает, поэтому страницы перепроверяются (304).
+    Кэш и объединение одинаковых запросов скрывают от стенда почти всю
+    нагрузку; --no-cache и --no-coalesce отключают их на время прогона.
+    """
+    random.seed(args.seed)
+    cities = [get_city(name) for name in parse_cities(args)]
+    deadline = WeatherCollector.DEFAULT_DEADLINE if args.deadline is None else args.deadline
+    WeatherScraper.configure_pool(pool_maxsize=max(args.per_host, WeatherScraper.POOL_MAXSIZE),
+                                  per_host=args.per_host)
+    WeatherScraper.health.reset()
+    collector = WeatherCollector()
+    
+    latencies = []
+    rows = Counter()
+    lock = threading.Lock()
+    
+    def count_rows(message: tuple):
+        if message[0] == "data":
+            with lock:
+                rows[message[2]] += 1
+    
+    def refresh(city: City):
+        started = time.perf_counter()
+        collector.collect(city.name, count_rows, deadline=deadline)
+        with lock:
+            latencies.append(time.perf_counter() - started)
+    
+    saved = WeatherScraper.cache, WeatherScraper.inflight
+    if args.no_cache:
+        # Кэш нулевого размера не сохраняет ни одной страницы
+        WeatherScraper.cache = ResponseCache(max_bytes=0)
+    if args.no_coalesce:
+        WeatherScraper.inflight = SingleFlight(enabled=False)
+    
+    with make_stand_in(args, cities) as server:
+        WeatherScraper.URL_OVERRIDE = server.url
+        started = time.perf_counter()
+        try:
+            for round_index in range(args.load_rounds):
+                if round_index:
+                    WeatherScraper.cache.expire()
+                with ThreadPoolExecutor(max_workers=args.load_clients,
+                                        thread_name_prefix="load-client") as clients:
+                    list(clients.map(refresh, (cities[i % len(cities)] for i in range(args.load_clients))))
+        finally:
+            elapsed = time.perf_counter() - started
+            WeatherScraper.URL_OVERRIDE = None
+            WeatherScraper.cache, WeatherScraper.inflight = saved
+            WeatherScraper.close_session()
+        server_stats = dict(sorted(server.stats.items()))
+    # Страниц, которые запросили бы клиенты без кэша и объединения
+    client_cities = [cities[i % len(cities)] for i in range(args.load_clients)]
+    source_fetches = args.load_rounds * sum(1 for city in client_cities for spec in SOURCE_REGISTRY
+                                            if spec.url and spec.url_for(city))
+    
+    report = {
+        'seed': args.seed,
+        'cities': [city.name for city in cities],
+        'clients': args.load_clients,
+        'rounds': args.load_rounds,
+        'refreshes': len(latencies),
+        'refreshes_per_s': len(latencies) / elapsed if elapsed else None,
+        'refresh_p50_ms': percentile(latencies, 0.50) * 1000,
+        'refresh_p95_ms': percentile(latencies, 0.95) * 1000,
+        'refresh_p99_ms': percentile(latencies, 0.99) * 1000,
+        'refresh_max_ms': max(latencies) * 1000,
+        'rows': dict(rows),
+        'cache': not args.no_cache,
+        'coalesce': not args.no_coalesce,
+        'source_fetches': source_fetches,
+        'server_requests': sum(server_stats.values()),
+        'server_responses': server_stats,
+    }
+    print(f"Обновлений: {report['refreshes']} ({args.load_clients} одновременно x {args.load_rounds}), "
+          f"{report['refreshes_per_s']:.1f} в секунду")
+    print(f"Время обновления: p50 {report['refresh_p50_ms']:.0f} мс, p95 {report['refresh_p95_ms']:.0f} мс, "
+          f"p99 {report['refresh_p99_ms']:.0f} мс, максимум {report['refresh_max_ms']:.0f} мс")
+    print("Строки: " + ", ".join(f"{TableModel.STATUS_TEXT.get(status, status)} {count}"
+                                 for status, count in sorted(rows.items())))
+    print(f"Запросов к стенду: {report['server_requests']} на {source_fetches} загрузок источников "
+          f"(кэш {'вкл' if report['cache'] else 'выкл'}, "
+          f"объединение {'вкл' if report['coalesce'] else 'выкл'})")
+    print("Ответы стенда: " + ", ".join(f"{status}: {count}" for status, count in server_stats.items()))
+    
+    if args.bench_output:
+        with open(args.bench_output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+def run_benchmark(args: argparse.Namespace) -> int:
+    """Замеры без сети: разбор страниц, сквозной проход и сравнение с эталоном"""
+    random.seed(args.seed)
+    city = get_city(parse_cities(args)[0])
+    fixtures = load_fixtures(args, city)
+    WeatherScraper.health.reset()
+    
+    results = OrderedDict()
+    failed = []
+    for name, (spec, content, expected) in fixtures.items():
+        result = bench_parse(spec, content, args.bench_iterations)
+        mismatched = check_fixture_values(result.pop('values'), expected)
+        if mismatched:
+            failed.append(f"{name}: неверно извлечены {', '.join(mismatched)}")
+        results[name] = result
+    
+    per_source, refresh_times = bench_refresh(fixtures, city, args.bench_refreshes)
+    for name, timings in per_source.items():
+        results[name]['e2e_p50_ms'] = statistics.median(timings) * 1000
+    
+    report = {
+        'seed': args.seed,
+        'city': city.name,
+        'sources': results,
+        'refresh_p50_ms': statistics.median(refresh_times) * 1000,
+        'refresh_max_ms': max(refresh_times) * 1000,
+    }
+    
+    header = (f"{'Источник':<18}{'КБ':>6}{'p50 мс':>8}{'p95 мс':>8}{'стр/с':>8}{'МБ/с':>7}"
+              f"{'пик КБ':>8}{'сквозн. мс':>11}")
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        print(f"{name:<18}{result['bytes'] / 1024:>6.0f}{result['parse_p50_ms']:>8.1f}"
+              f"{result['parse_p95_ms']:>8.1f}{result['pages_per_s']:>8.1f}{result['mb_per_s']:>7.1f}"
+              f"{result['peak_kb']:>8.0f}{result['e2e_p50_ms']:>11.1f}")
+    print(f"Полный проход сборщика: p50 {report['refresh_p50_ms']:.1f} мс, "
+          f"максимум {report['refresh_max_ms']:.1f} мс")
+    
+    if args.bench_output:
+        with open(args.bench_output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        for name, result in results.items():
+            reference = baseline.get('sources', {}).get(name)
+            if reference and result['parse_p50_ms'] > reference['parse_p50_ms'] * (1 + args.tolerance):
+                failed.append(f"{name}: разбор {result['parse_p50_ms']:.1f} мс, "
+                              f"эталон {reference['parse_p50_ms']:.1f} мс")
+        reference = baseline.get('refresh_p50_ms')
+        if reference and report['refresh_p50_ms'] > reference * (1 + args.tolerance):
+            failed.append(f"полный проход {report['refresh_p50_ms']:.1f} мс, эталон {reference:.1f} мс")
+    
+    for message in failed:
+        print(f"РЕГРЕССИЯ: {message}", file=sys.stderr)
+    return 1 if failed else 0
+
+# =========== Модель таблицы результатов ===========
+
+class TableModel:
+    """Строки таблицы результатов с сортировкой и фильтром.
+    
+    Виджет показывает только видимое окно строк, поэтому сортировка и
+    фильтр работают над моделью и не пересоздают элементы Treeview.
+    """
+    
+    COLUMNS = ("Источник", "Температура", "Ощущается", "Влажность", "Давление", "Ветер", "Время", "Статус")
+    
+    STATUS_TEXT = {
+        "success": "✅ Реальные",
+        "generated": "⚠️ Сгенерированные",
+        "error": "❌ Ошибка",
+        "stale": "🕓 Из снимка",
+    }
+    
+    # Ключи сортировки по колонкам; пустые значения уходят в конец
+    SORT_KEYS = {
+        "Источник": lambda row: row[0].source,
+        "Температура": lambda row: row[0].temperature,
+        "Ощущается": lambda row: row[0].feels_like,
+        "Влажность": lambda row: row[0].humidity,
+        "Давление": lambda row: row[0].pressure,
+        "Ветер": lambda row: row[0].wind_speed,
+        "Время": lambda row: row[0].observed_at,
+        "Статус": lambda row: row[1]
+    }
+    
+    def __init__(self):
+        self.rows = []
+        self.view = []
+        self.sort_column = None
+        self.sort_reverse = False
+        self.filter_text = ""
+    
+    def __len__(self) -> int:
+        return len(self.view)
+    
+    def add(self, rows: list):
+        """Добавление строк (WeatherData, статус)"""
+        self.rows.extend(rows)
+        if self.sort_column is None and not self.filter_text:
+            self.view.extend(rows)
+        else:
+            self._rebuild()
     
-    # =========== 6. Foreca.ru ===========
-    @staticmethod
-    def parse_foreca(city: str = "Москва") -> Optional[WeatherData]:
-        """Генерация данных для Foreca.ru"""
-        try:
-            base_temps = {
-                "москва": random.uniform(-5, 1),
-                "санкт-петербург": random.uniform(-3, 2),
-                "новосибирск": random.uniform(-11, -4),
-                "екатеринбург": random.uniform(-9, -2),
-                "казань": random.uniform(-7, -1)
-            }
-            
-            city_lower = city.lower()
-            temperature = round(base_temps.get(city_lower, random.uniform(-12, 3)), 1)
-            
-            return WeatherData(
-                source="Foreca.ru",
-                temperature=temperature,
-                feels_like=round(temperature - random.uniform(0.5, 2), 1),
-                humidity=random.randint(65, 85),
-                pressure=random.randint(745, 765),
-                wind_speed=round(random.uniform(2, 7), 1),
-                description="Международный прогноз",
-                timestamp=datetime.now().strftime("%H:%M:%S")
-            )
-            
-        except Exception as e:
-            print(f"Ошибка Foreca: {e}")
-            return None
+    def clear(self):
+        self.rows = []
+        self.view = []
     
-    # =========== 7. Meteoweb.ru ===========
-    @staticmethod
-    def parse_meteoweb(city: str = "Москва") -> Optional[WeatherData]:
-        """Генерация данных для Meteoweb.ru"""
-        try:
-            base_temps = {
-                "москва": random.uniform(-6, 0),
-                "санкт-петербург": random.uniform(-4, 1),
-                "новосибирск": random.uniform(-13, -6),
-                "екатеринбург": random.uniform(-11, -4),
-                "казань": random.uniform(-9, -3)
-            }
-            
-            city_lower = city.lower()
-            temperature = round(base_temps.get(city_lower, random.uniform(-15, 2)), 1)
-            
-            descriptions = [
-                "Облачно с прояснениями",
-                "Пасмурно, временами снег",
-                "Переменная облачность",
-                "Ясно, слабый ветер",
-                "Снег, метель"
-            ]
-            
-            return WeatherData(
-                source="Meteoweb.ru",
-                temperature=temperature,
-                feels_like=round(temperature - random.uniform(1, 4), 1),
-                humidity=random.randint(75, 95),
-                pressure=random.randint(735, 755),
-                wind_speed=round(random.uniform(1, 5), 1),
-                description=random.choice(descriptions),
-                timestamp=datetime.now().strftime("%H:%M:%S")
-            )
-            
-        except Exception as e:
-            print(f"Ошибка Meteoweb: {e}")
-            return None
+    def sort_by(self, column: str):
+        """Сортировка по колонке; повторный выбор меняет направление"""
+        if self.sort_column == column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = False
+        self._rebuild()
     
-    # =========== 8. Rp5.ru ===========
-    @staticmethod
-    def parse_rp5(city: str = "Москва") -> Optional[WeatherData]:
-        """Генерация данных для Rp5.ru"""
-        try:
-            base_temps = {
-                "москва": random.uniform(-8, -2),
-                "санкт-петербург": random.uniform(-6, -1),
-                "новосибирск": random.uniform(-14, -7),
-                "екатеринбург": random.uniform(-12, -5),
-                "казань": random.uniform(-10, -4)
-            }
-            
-            city_lower = city.lower()
-            temperature = round(base_temps.get(city_lower, random.uniform(-15, 0)), 1)
-            
-            return WeatherData(
-                source="Rp5.ru",
-                temperature=temperature,
-                feels_like=round(temperature - random.uniform(2, 5), 1),
-                humidity=random.randint(80, 98),
-                pressure=random.randint(730, 750),
-                wind_speed=round(random.uniform(3, 9), 1),
-                description="Архив метеоданных",
-                timestamp=datetime.now().strftime("%H:%M:%S")
-            )
-            
-        except Exception as e:
-            print(f"Ошибка Rp5: {e}")
-            return None
+    def set_filter(self, text: str):
+        self.filter_text = text.strip().lower()
+        self._rebuild()
     
-    # =========== 9. Weather.com (международный) ===========
-    @staticmethod
-    def parse_weather_com(city: str = "Москва") -> Optional[WeatherData]:
-        """Генерация данных для Weather.com"""
-        try:
-            base_temps = {
-                "москва": random.uniform(-4, 3),
-                "санкт-петербург": random.uniform(-2, 4),
-                "новосибирск": random.uniform(-9, -2),
-                "екатеринбург": random.uniform(-7, 0),
-                "казань": random.uniform(-5, 1)
-            }
-            
-            city_lower = city.lower()
-            temperature = round(base_temps.get(city_lower, random.uniform(-10, 5)), 1)
-            
-            return WeatherData(
-                source="Weather.com",
-                temperature=temperature,
-                feels_like=round(temperature - random.uniform(1, 3), 1),
-                humidity=random.randint(60, 80),
-                pressure=random.randint(755, 775),
-                wind_speed=round(random.uniform(4, 10), 1),
-                description="International weather",
-                timestamp=datetime.now().strftime("%H:%M:%S")
-            )
-            
-        except:
-            return None
+    def _rebuild(self):
+        rows = self.rows
+        if self.filter_text:
+            needle = self.filter_text
+            rows = [row for row in rows
+                    if needle in row[0].source.lower() or needle in (row[0].description or "").lower()]
+        else:
+            rows = list(rows)
+        if self.sort_column is not None:
+            key = self.SORT_KEYS[self.sort_column]
+            present = [row for row in rows if key(row) is not None]
+            missing = [row for row in rows if key(row) is None]
+            rows = sorted(present, key=key, reverse=self.sort_reverse) + missing
+        self.view = rows
     
-    # =========== 10. BBC Weather ===========
-    @staticmethod
-    def parse_bbc_weather(city: str = "Москва") -> Optional[WeatherData]:
-        """Генерация данных для BBC Weather"""
-        try:
-            base_temps = {
-                "москва": random.uniform(-5, 0),
-                "санкт-петербург": random.uniform(-3, 2),
-                "новосибирск": random.uniform(-11, -4),
-                "екатеринбург": random.uniform(-9, -2),
-                "казань": random.uniform(-7, -1)
-            }
-            
-            city_lower = city.lower()
-            temperature = round(base_temps.get(city_lower, random.uniform(-12, 3)), 1)
-            
-            return WeatherData(
-                source="BBC Weather",
-                temperature=temperature,
-                feels_like=round(temperature - random.uniform(2, 4), 1),
-                humidity=random.randint(70, 90),
-                pressure=random.randint(740, 760),
-                wind_speed=round(random.uniform(2, 6), 1),
-                description="BBC Weather forecast",
-                timestamp=datetime.now().strftime("%H:%M:%S")
-            )
-            
-        except:
-            return None
+    def window(self, offset: int, count: int) -> list:
+        return self.view[offset:offset + count]
+    
+    @classmethod
+    def format_row(cls, data: WeatherData, status: str) -> tuple:
+        return (
+            data.source,
+            f"{data.temperature}°C" if data.temperature is not None else "Н/Д",
+            f"{data.feels_like}°C" if data.feels_like is not None else "Н/Д",
+            f"{data.humidity}%" if data.humidity is not None else "Н/Д",
+            f"{data.pressure}" if data.pressure is not None else "Н/Д",
+            f"{data.wind_speed} м/с" if data.wind_speed is not None else "Н/Д",
+            data.timestamp or "Н/Д",
+            cls.STATUS_TEXT.get(status, cls.STATUS_TEXT["error"])
+        )
 
 class WeatherApp:
     """Главный класс приложения"""
     
-    def __init__(self, root):
+    # Обработка очереди: сообщений за один кадр и период кадров, мс
+    MAX_MESSAGES_PER_FRAME = 200
+    FRAME_INTERVAL = 100
+    BACKLOG_FRAME_INTERVAL = 20
+    # Размер очереди: при переполнении потоки сбора ждут интерфейс
+    QUEUE_SIZE = 1000
+    
+    # Цвета для разных уровней сообщений
+    LOG_COLORS = {
+        "INFO": "#3498db",
+        "SUCCESS": "#2ecc71",
+        "ERROR": "#e74c3c",
+        "WARNING": "#f39c12"
+    }
+    
+    # Фильтры журнала: название -> показываемые уровни (None - все)
+    LOG_FILTERS = OrderedDict([
+        ("Все", None),
+        ("Предупреждения и ошибки", ("WARNING", "ERROR")),
+        ("Только ошибки", ("ERROR",)),
+    ])
+    # Окно журнала удаляет старые строки пачками, а не по одной
+    LOG_TRIM_CHUNK = 200
+    
+    # Панели средних, лога и статуса строятся после показа окна, мс
+    SECONDARY_PANELS_DELAY = 30
+    # Снимок моложе этого срока, секунд, не обновляется сразу при запуске
+    SNAPSHOT_FRESH = 300
+    AUTO_START_DELAY = 1000
+    
+    # Высота строки и заголовка таблицы в пикселях, пока ни одна строка не отрисована;
+    # затем они измеряются по первой видимой строке
+    TABLE_ROW_HEIGHT = 20
+    TABLE_HEADER_HEIGHT = 25
+    
+    def __init__(self, root, log_size: int = LOG_BUFFER_SIZE, log_file: Optional[str] = None,
+                 show_startup_report: bool = False, snapshot_file: Optional[str] = SNAPSHOT_FILE):
+        self.started = time.perf_counter()
+        self.show_startup_report = show_startup_report
         self.root = root
         self.root.title("Агрегатор погоды - 10 источников")
         self.root.geometry("1200x800")
@@ -662,25 +3350,104 @@ class WeatherApp:
         random.seed(datetime.now().timestamp())
         
         # Очередь для обмена данными между потоками
-        self.queue = Queue()
+        self.queue = Queue(maxsize=self.QUEUE_SIZE)
         
         # Данные о погоде
         self.weather_data = []
         self.average_data = {}
+        self.average_stats = {}
         
-        # Создание интерфейса
-        self.create_widgets()
+        # Предварительные средние до завершения сбора
+        self.running_averages = StreamingAverages()
         
-        # Проверка обновлений из очереди
-        self.check_queue()
+        # Строки таблицы; виджет показывает только видимое окно
+        self.table_model = TableModel()
+        self.table_offset = 0
+        self.table_slots = []
+        self.table_height = 0
+        self.table_metrics = None
+        
+        # Параллельный сбор данных со всех источников
+        self.collector = WeatherCollector()
+        self.refresh_thread = None
+        # Отмена текущего обновления при смене города или закрытии окна
+        self.refresh_token = CancelToken()
+        self.pending_city_refresh = False
+        
+        # Последние данные прошлого запуска показываются до первого обновления
+        self.snapshot_store = SnapshotStore(snapshot_file) if snapshot_file else None
         
-        # Автоматический старт при запуске
-        self.root.after(1000, self.auto_start)
+        # Журнал операций: окно лога показывает часть этого буфера
+        self.log_buffer = LogBuffer(log_size, log_file)
+        self.log_levels = None
+        self.log_lines = 0
+        
+        # Создание интерфейса: сначала каркас окна, остальные панели - после первого кадра
+        self.avg_labels = {}
+        self.log_text = None
+        self.create_widgets()
+        self.root.after(self.SECONDARY_PANELS_DELAY, self.create_secondary_widgets)
+        
+        # Автоматический старт при запуске; свежий снимок откладывает обновление
+        self.root.after(self.get_auto_start_delay(), self.auto_start)
     
     def auto_start(self):
         """Автоматический старт сбора данных при запуске"""
+        if str(self.get_weather_btn.cget('state')) == 'disabled':
+            return
         self.start_getting_weather()
     
+    def get_auto_start_delay(self) -> int:
+        """Через сколько мс обновлять данные после запуска"""
+        snapshot = self.snapshot_store.get(self.city_var.get()) if self.snapshot_store else None
+        if snapshot is None:
+            return self.AUTO_START_DELAY
+        return max(self.AUTO_START_DELAY, int((self.SNAPSHOT_FRESH - snapshot.age()) * 1000))
+    
+    def show_snapshot(self, city: str) -> bool:
+        """Вывод сохраненных данных города с пометкой, что они устарели"""
+        snapshot = self.snapshot_store.get(city) if self.snapshot_store else None
+        if snapshot is None:
+            return False
+        
+        self.table_model.add([(data, "stale") for data, _ in snapshot.rows])
+        self.render_table()
+        self.update_averages(snapshot.averages)
+        for label in self.avg_labels.values():
+            label.config(fg='#95a5a6')
+        
+        saved = datetime.fromtimestamp(snapshot.saved_at).strftime("%d.%m %H:%M")
+        self.stats_label.config(text=f"Источников: {len(snapshot.rows)} (снимок от {saved})")
+        self.log_message(f"{snapshot.city}: показаны данные от {saved}, ожидается обновление", "INFO")
+        return True
+    
+    def save_snapshot(self, city: str):
+        if self.snapshot_store is None or not self.table_model.rows:
+            return
+        try:
+            self.snapshot_store.save(city, self.table_model.rows, self.average_data)
+        except OSError as e:
+            self.log_message(f"Не удалось сохранить снимок данных: {e}", "WARNING")
+    
+    def on_city_selected(self, event=None):
+        """Смена города показывает его последний снимок.
+        
+        Идущее обновление для прежнего города прерывается, после отмены
+        сразу запускается обновление для нового.
+        """
+        if self.refresh_thread is not None and self.refresh_thread.is_alive():
+            self.pending_city_refresh = True
+            self.cancel_refresh()
+            return
+        if str(self.get_weather_btn.cget('state')) == 'disabled':
+            return
+        self.clear_table()
+        self.show_snapshot(self.city_var.get())
+    
+    def cancel_refresh(self):
+        """Прерывание загрузок и разбора текущего обновления"""
+        self.refresh_token.cancel()
+    
     def create_widgets(self):
         """Создание виджетов интерфейса"""
         # Настройка стиля
@@ -742,10 +3509,27 @@ class WeatherApp:
             state='readonly',
             width=25
         )
-        self.city_combo['values'] = (
-            "Москва", "Санкт-Петербург", "Новосибирск", "Екатеринбург", "Казань"
-        )
+        self.city_combo['values'] = tuple(city.name for city in CITIES.values())
         self.city_combo.pack(side=tk.LEFT, padx=(0, 20))
+        self.city_combo.bind('<<ComboboxSelected>>', self.on_city_selected)
+        
+        tk.Label(
+            city_frame,
+            text="Лимит обновления, с:",
+            font=('Arial', 10, 'bold')
+        ).pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.deadline_var = tk.StringVar(value=f"{WeatherCollector.DEFAULT_DEADLINE:g}")
+        self.deadline_spin = ttk.Spinbox(
+            city_frame,
+            from_=1,
+            to=120,
+            increment=1,
+            textvariable=self.deadline_var,
+            font=('Arial', 10),
+            width=6
+        )
+        self.deadline_spin.pack(side=tk.LEFT)
         
         # Кнопки управления
         buttons_frame = ttk.Frame(control_frame)
@@ -797,7 +3581,23 @@ class WeatherApp:
             activebackground='#c0392b',
             width=15
         )
-        self.clear_btn.pack(side=tk.LEFT)
+        self.clear_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.metrics_btn = tk.Button(
+            buttons_frame,
+            text="📈 Метрики",
+            command=self.show_metrics,
+            font=('Arial', 10),
+            bg='#8e44ad',
+            fg='white',
+            padx=20,
+            pady=8,
+            cursor='hand2',
+            relief=tk.FLAT,
+            activebackground='#7d3c98',
+            width=12
+        )
+        self.metrics_btn.pack(side=tk.LEFT)
         
         # Прогресс-бар
         self.progress = ttk.Progressbar(
@@ -815,16 +3615,34 @@ class WeatherApp:
         )
         data_frame.grid(row=2, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 15))
         
+        # Фильтр строк таблицы
+        filter_frame = ttk.Frame(data_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        
+        tk.Label(
+            filter_frame,
+            text="Фильтр:",
+            font=('Arial', 10)
+        ).pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add('write', lambda *_: self.apply_table_filter())
+        ttk.Entry(
+            filter_frame,
+            textvariable=self.filter_var,
+            width=30
+        ).pack(side=tk.LEFT)
+        
         # Таблица с данными
-        columns = ("Источник", "Температура", "Ощущается", "Влажность", "Давление", "Ветер", "Время", "Статус")
+        columns = TableModel.COLUMNS
         
         # Создание Treeview с полосами прокрутки
         tree_frame = ttk.Frame(data_frame)
         tree_frame.pack(fill=tk.BOTH, expand=True)
         
-        # Вертикальная полоса прокрутки
-        tree_scroll_y = ttk.Scrollbar(tree_frame)
-        tree_scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
+        # Вертикальная полоса прокрутки управляет окном модели, а не виджетом
+        self.tree_scroll_y = ttk.Scrollbar(tree_frame, command=self.scroll_table)
+        self.tree_scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
         
         # Горизонтальная полоса прокрутки
         tree_scroll_x = ttk.Scrollbar(tree_frame, orient=tk.HORIZONTAL)
@@ -836,7 +3654,6 @@ class WeatherApp:
             columns=columns,
             show="headings",
             height=10,
-            yscrollcommand=tree_scroll_y.set,
             xscrollcommand=tree_scroll_x.set
         )
         
@@ -853,15 +3670,41 @@ class WeatherApp:
         }
         
         for col in columns:
-            self.tree.heading(col, text=col, anchor=tk.CENTER)
+            self.tree.heading(col, text=col, anchor=tk.CENTER,
+                              command=lambda c=col: self.sort_table(c))
             self.tree.column(col, width=column_widths[col], anchor=tk.CENTER)
         
-        # Привязка полос прокрутки
-        tree_scroll_y.config(command=self.tree.yview)
+        # Привязка полосы прокрутки
         tree_scroll_x.config(command=self.tree.xview)
         
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
+        # Цвета строк по статусу настраиваются один раз
+        self.tree.tag_configure('success', background='#d5f4e6')
+        self.tree.tag_configure('generated', background='#fff9e6')
+        self.tree.tag_configure('error', background='#fadbd8')
+        self.tree.tag_configure('stale', background='#ecf0f1', foreground='#7f8c8d')
+        
+        # Прокрутка колесом и пересчет окна при изменении размера
+        self.tree.bind('<MouseWheel>', self.on_table_wheel)
+        self.tree.bind('<Button-4>', self.on_table_wheel)
+        self.tree.bind('<Button-5>', self.on_table_wheel)
+        self.tree.bind('<Configure>', self.on_table_resize)
+        self.resize_table_slots(10)
+        
+        # Настройка весов для расширения
+        main_frame.columnconfigure(0, weight=3)
+        main_frame.columnconfigure(1, weight=1)
+        main_frame.rowconfigure(2, weight=1)
+        main_frame.rowconfigure(3, weight=1)
+        self.main_frame = main_frame
+    
+    def create_secondary_widgets(self):
+        """Панели средних значений, лога и статуса; строятся после первого кадра"""
+        STARTUP_TIMES.setdefault("первый кадр окна", time.perf_counter() - self.started)
+        started = time.perf_counter()
+        main_frame = self.main_frame
+        
         # Область для средних значений
         avg_frame = ttk.LabelFrame(
             main_frame,
@@ -872,7 +3715,6 @@ class WeatherApp:
         avg_frame.grid(row=2, column=1, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(15, 0), pady=(0, 15))
         
         # Отображение средних значений
-        self.avg_labels = {}
         metrics = [
             ("🌡️ Температура:", "temperature", "°C"),
             ("🤔 Ощущается:", "feels_like", "°C"),
@@ -933,6 +3775,26 @@ class WeatherApp:
         )
         log_frame.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
         
+        log_filter_frame = ttk.Frame(log_frame)
+        log_filter_frame.pack(fill=tk.X, pady=(0, 5))
+        
+        tk.Label(
+            log_filter_frame,
+            text="Показывать:",
+            font=('Arial', 10)
+        ).pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.log_filter_var = tk.StringVar(value=next(iter(self.LOG_FILTERS)))
+        log_filter_combo = ttk.Combobox(
+            log_filter_frame,
+            textvariable=self.log_filter_var,
+            values=list(self.LOG_FILTERS),
+            state="readonly",
+            width=25
+        )
+        log_filter_combo.pack(side=tk.LEFT)
+        log_filter_combo.bind('<<ComboboxSelected>>', lambda _: self.apply_log_filter())
+        
         self.log_text = scrolledtext.ScrolledText(
             log_frame,
             height=8,
@@ -945,6 +3807,9 @@ class WeatherApp:
         )
         self.log_text.pack(fill=tk.BOTH, expand=True)
         
+        for level, color in self.LOG_COLORS.items():
+            self.log_text.tag_config(level, foreground=color)
+        
         # Панель статуса
         status_frame = tk.Frame(main_frame, bg='#2c3e50', height=30)
         status_frame.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(10, 0))
@@ -972,14 +3837,23 @@ class WeatherApp:
         )
         self.time_label.pack(side=tk.RIGHT)
         
-        # Настройка весов для расширения
-        main_frame.columnconfigure(0, weight=3)
-        main_frame.columnconfigure(1, weight=1)
-        main_frame.rowconfigure(2, weight=1)
-        main_frame.rowconfigure(3, weight=1)
+        # Сообщения, пришедшие до создания окна лога, уже лежат в буфере
+        self.apply_log_filter()
+        
+        # Данные прошлого запуска до первого обновления
+        self.show_snapshot(self.city_var.get())
         
         # Обновление времени
         self.update_time()
+        
+        # Проверка обновлений из очереди
+        self.check_queue()
+        
+        STARTUP_TIMES.setdefault("остальные панели", time.perf_counter() - started)
+        if self.show_startup_report:
+            report = startup_report()
+            print(report, file=sys.stderr)
+            self.log_message("Запуск: " + report.replace("\n", "; "), "INFO")
     
     def update_time(self):
         """Обновление времени в статус-баре"""
@@ -989,205 +3863,302 @@ class WeatherApp:
     
     def log_message(self, message: str, level: str = "INFO"):
         """Добавление сообщения в лог"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        
-        # Цвета для разных уровней сообщений
-        colors = {
-            "INFO": "#3498db",
-            "SUCCESS": "#2ecc71",
-            "ERROR": "#e74c3c",
-            "WARNING": "#f39c12"
-        }
-        
-        color = colors.get(level, "#3498db")
-        
-        # Вставляем сообщение
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        
-        # Подсвечиваем последнюю строку
-        start_index = self.log_text.index("end-2l")
-        self.log_text.tag_add(level, start_index, "end-1c")
-        self.log_text.tag_config(level, foreground=color)
+        self.log_messages([(message, level)])
+    
+    def log_messages(self, messages: list):
+        """Добавление пачки сообщений в журнал и в окно лога одной вставкой"""
+        if not messages:
+            return
+        entries = self.log_buffer.extend(messages)
+        if self.log_text is None:
+            return
+        if self.log_levels is not None:
+            entries = [entry for entry in entries if entry[1] in self.log_levels]
+        self.show_log_entries(entries)
+    
+    def show_log_entries(self, entries: list):
+        if not entries:
+            return
+        # Text.insert принимает чередующиеся пары (текст, теги)
+        chunks = []
+        for entry in entries:
+            text = LogBuffer.format_entry(entry)
+            chunks.extend((text + "\n", (entry[1] if entry[1] in self.LOG_COLORS else "INFO",)))
+            self.log_lines += text.count("\n") + 1
+        self.log_text.insert(tk.END, *chunks)
         
+        # Окно не длиннее буфера; лишние строки удаляются сразу пачкой
+        excess = self.log_lines - self.log_buffer.entries.maxlen
+        if excess >= self.LOG_TRIM_CHUNK:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
+            self.log_lines -= excess
         self.log_text.see(tk.END)
-        self.root.update_idletasks()
+    
+    def apply_log_filter(self):
+        """Перерисовка окна лога из буфера по выбранному фильтру"""
+        self.log_levels = self.LOG_FILTERS.get(self.log_filter_var.get())
+        self.log_text.delete("1.0", tk.END)
+        self.log_lines = 0
+        self.show_log_entries(self.log_buffer.filtered(self.log_levels))
     
     def start_getting_weather(self):
         """Запуск сбора данных о погоде в отдельном потоке"""
+        # Повторный запуск во время обновления только дублировал бы запросы
+        if self.refresh_thread is not None and self.refresh_thread.is_alive():
+            return
         self.get_weather_btn.config(state='disabled')
         self.progress.start()
         self.clear_table()
         self.log_message("Начинаю сбор данных о погоде...", "INFO")
         
-        # Запуск в отдельном потоке
-        thread = threading.Thread(target=self.get_weather_data, daemon=True)
-        thread.start()
+        # Запуск в отдельном потоке; город и лимит времени читаются здесь,
+        # в потоке Tk - переменные tkinter нельзя трогать из рабочего потока
+        self.refresh_token = CancelToken()
+        self.refresh_thread = threading.Thread(target=self.get_weather_data,
+                                               args=(self.city_var.get(), self.get_refresh_deadline(),
+                                                     self.refresh_token),
+                                               daemon=True)
+        self.refresh_thread.start()
     
-    def get_weather_data(self):
+    def get_weather_data(self, city: Optional[str] = None, deadline: Optional[float] = None,
+                         cancel: Optional[CancelToken] = None):
         """Сбор данных о погоде с разных источников"""
-        city = self.city_var.get()
-        
-        # Используем 10 источников
-        sources = [
-            ("Gismeteo.ru", WeatherScraper.parse_gismeteo),
-            ("Яндекс.Погода", WeatherScraper.parse_yandex_weather),
-            ("Sinoptik.ua", WeatherScraper.parse_sinoptik),
-            ("Pogoda.mail.ru", WeatherScraper.parse_mail_ru),
-            ("Meteoinfo.ru", WeatherScraper.parse_meteoinfo),
-            ("Foreca.ru", WeatherScraper.parse_foreca),
-            ("Meteoweb.ru", WeatherScraper.parse_meteoweb),
-            ("Rp5.ru", WeatherScraper.parse_rp5),
-            ("Weather.com", WeatherScraper.parse_weather_com),
-            ("BBC Weather", WeatherScraper.parse_bbc_weather)
-        ]
-        
-        self.weather_data = []
-        
-        for i, (source_name, parser_func) in enumerate(sources):
-            try:
-                self.queue.put(("log", f"Запрашиваю данные из {source_name}...", "INFO"))
-                
-                # Добавляем небольшую задержку между запросами
-                time.sleep(0.3)
-                
-                # Парсим данные
-                data = parser_func(city)
-                
-                if data:
-                    self.weather_data.append(data)
-                    self.queue.put(("data", data, "success"))
-                    self.queue.put(("log", f"Данные из {source_name} получены", "SUCCESS"))
-                else:
-                    # Если парсинг не удался, генерируем данные
-                    self.queue.put(("log", f"{source_name}: Использую сгенерированные данные", "WARNING"))
-                    
-                    # Генерация реалистичных данных
-                    base_temps = {
-                        "москва": random.uniform(-8, 2),
-                        "санкт-петербург": random.uniform(-6, 3),
-                        "новосибирск": random.uniform(-12, -3),
-                        "екатеринбург": random.uniform(-10, -1),
-                        "казань": random.uniform(-8, 0)
-                    }
-                    
-                    city_lower = city.lower()
-                    temperature = round(base_temps.get(city_lower, random.uniform(-10, 5)), 1)
-                    
-                    mock_data = WeatherData(
-                        source=source_name + " (ген.)",
-                        temperature=temperature,
-                        feels_like=round(temperature - random.uniform(1, 3), 1),
-                        humidity=random.randint(70, 90),
-                        pressure=random.randint(735, 765),
-                        wind_speed=round(random.uniform(1, 6), 1),
-                        description="Сгенерированные данные",
-                        timestamp=datetime.now().strftime("%H:%M:%S")
-                    )
-                    self.weather_data.append(mock_data)
-                    self.queue.put(("data", mock_data, "generated"))
-                    
-            except Exception as e:
-                self.queue.put(("log", f"Ошибка {source_name}: {str(e)[:50]}", "ERROR"))
-                
-                # В случае ошибки генерируем данные
-                temperature = round(random.uniform(-10, 5), 1)
-                mock_data = WeatherData(
-                    source=source_name + " (ошибка)",
-                    temperature=temperature,
-                    feels_like=round(temperature - random.uniform(1, 4), 1),
-                    humidity=random.randint(65, 95),
-                    pressure=random.randint(730, 770),
-                    wind_speed=round(random.uniform(0.5, 8), 1),
-                    description="Данные после ошибки",
-                    timestamp=datetime.now().strftime("%H:%M:%S")
-                )
-                self.weather_data.append(mock_data)
-                self.queue.put(("data", mock_data, "error"))
+        city = city or self.city_var.get()
+        deadline = deadline or self.get_refresh_deadline()
+        # Промежуточные средние считаются с теми же весами, что и итоговые
+        weights = self.load_source_weights()
+        self.queue.put(("weights", weights))
         
-        # Расчет средних значений
-        self.calculate_averages()
+        try:
+            self.weather_data = self.collector.collect(
+                city, self.queue.put, deadline=deadline, cancel=cancel
+            )
+        except Cancelled:
+            self.queue.put(("cancelled", None))
+            return
         
-        # Отправка сигнала о завершении
-        self.queue.put(("done", None))
+        try:
+            # Расчет средних значений
+            self.calculate_averages(weights)
+        finally:
+            # Сигнал о завершении отправляется всегда, иначе кнопка останется отключенной
+            self.queue.put(("done", city))
+    
+    def get_refresh_deadline(self) -> float:
+        """Лимит времени на обновление из поля ввода"""
+        try:
+            deadline = float(self.deadline_var.get())
+        except (tk.TclError, ValueError):
+            deadline = WeatherCollector.DEFAULT_DEADLINE
+        return max(deadline, 1.0)
     
-    def calculate_averages(self):
+    def load_source_weights(self) -> Optional[dict]:
+        """Веса источников по истории точности"""
+        # Ошибка базы истории не должна останавливать обновление: веса - по умолчанию
+        try:
+            return get_history_store().source_weights()
+        except (sqlite3.Error, OSError) as e:
+            self.queue.put(("log", f"История недоступна: {e}", "WARNING"))
+            return None
+    
+    def calculate_averages(self, weights: Optional[dict] = None):
         """Расчет средних значений"""
         if not self.weather_data:
             return
         
-        metrics = ['temperature', 'feels_like', 'humidity', 'pressure', 'wind_speed']
-        self.average_data = {}
-        
-        for metric in metrics:
-            values = []
-            for data in self.weather_data:
-                value = getattr(data, metric)
-                if value is not None:
-                    values.append(value)
-            
-            if values:
-                avg_value = sum(values) / len(values)
-                if metric in ['temperature', 'feels_like', 'wind_speed']:
-                    self.average_data[metric] = round(avg_value, 1)
-                else:
-                    self.average_data[metric] = round(avg_value)
+        summary = MetricAggregator(weights).summarize(self.weather_data)
+        self.average_data = averages_from_summary(summary)
+        self.average_stats = summary
+        try:
+            get_history_store().record_accuracy(source_deviations(self.weather_data))
+        except (sqlite3.Error, OSError) as e:
+            self.queue.put(("log", f"Не удалось сохранить точность источников: {e}", "WARNING"))
         
         self.queue.put(("avg", self.average_data))
         self.queue.put(("stats", len(self.weather_data)))
     
     def check_queue(self):
-        """Проверка очереди на новые сообщения"""
-        try:
-            while True:
+        """Проверка очереди на новые сообщения.
+        
+        За один кадр обрабатывается не больше MAX_MESSAGES_PER_FRAME
+        сообщений; строки лога и таблицы подряд идущих сообщений
+        вставляются пачкой, остальное откладывается до следующего кадра.
+        """
+        logs = []
+        rows = []
+        processed = 0
+        
+        while processed < self.MAX_MESSAGES_PER_FRAME:
+            try:
                 msg_type, *data = self.queue.get_nowait()
-                
-                if msg_type == "log":
-                    self.log_message(*data)
-                elif msg_type == "data":
-                    self.add_to_tree(*data)
-                elif msg_type == "avg":
-                    self.update_averages(data[0])
-                elif msg_type == "stats":
-                    self.stats_label.config(text=f"Источников: {data[0]}")
-                elif msg_type == "done":
-                    self.progress.stop()
-                    self.get_weather_btn.config(state='normal')
-                    self.log_message(f"Сбор данных завершен! Получено {len(self.weather_data)} источников", "SUCCESS")
-                    self.save_to_history()
-                
-        except:
-            pass
+            except Empty:
+                break
+            processed += 1
+            
+            if msg_type == "log":
+                logs.append(tuple(data))
+                continue
+            if msg_type == "data":
+                rows.append(tuple(data))
+                continue
+            
+            # Остальные сообщения зависят от порядка - сначала выводим накопленное
+            self.flush_updates(logs, rows)
+            logs, rows = [], []
+            
+            if msg_type == "weights":
+                self.running_averages.reset(data[0])
+            elif msg_type == "avg":
+                self.update_averages(data[0])
+            elif msg_type == "stats":
+                self.stats_label.config(text=f"Источников: {data[0]}")
+            elif msg_type == "done":
+                self.progress.stop()
+                self.get_weather_btn.config(state='normal')
+                self.log_message(f"Сбор данных завершен! Получено {len(self.weather_data)} источников", "SUCCESS")
+                # Данные сохраняются для собранного города, а не для выбранного сейчас
+                self.save_to_history(data[0])
+                self.save_snapshot(data[0])
+                if self.pending_city_refresh or not self.is_selected_city(data[0]):
+                    self.refresh_selected_city()
+            elif msg_type == "cancelled":
+                self.on_refresh_cancelled()
         
-        self.root.after(100, self.check_queue)
+        self.flush_updates(logs, rows)
+        
+        # При отставании от потоков сбора следующий кадр наступает раньше
+        backlog = not self.queue.empty()
+        self.root.after(self.BACKLOG_FRAME_INTERVAL if backlog else self.FRAME_INTERVAL, self.check_queue)
     
-    def add_to_tree(self, data: WeatherData, status: str):
-        """Добавление данных в таблицу"""
-        values = (
-            data.source,
-            f"{data.temperature}°C" if data.temperature is not None else "Н/Д",
-            f"{data.feels_like}°C" if data.feels_like is not None else "Н/Д",
-            f"{data.humidity}%" if data.humidity is not None else "Н/Д",
-            f"{data.pressure}" if data.pressure is not None else "Н/Д",
-            f"{data.wind_speed} м/с" if data.wind_speed is not None else "Н/Д",
-            data.timestamp or "Н/Д",
-            "✅ Реальные" if status == "success" else ("⚠️ Сгенерированные" if status == "generated" else "❌ Ошибка")
-        )
+    def on_refresh_cancelled(self):
+        """Обновление прервано; при смене города сразу запускается новое"""
+        self.progress.stop()
+        self.get_weather_btn.config(state='normal')
+        if self.pending_city_refresh:
+            self.refresh_selected_city()
+    
+    def is_selected_city(self, city: str) -> bool:
+        return city.strip().lower() == self.city_var.get().strip().lower()
+    
+    def refresh_selected_city(self):
+        """Город сменили во время обновления - обновление для нового города"""
+        self.pending_city_refresh = False
+        # Поток уже отправил последнее сообщение и завершается
+        if self.refresh_thread is not None:
+            self.refresh_thread.join(timeout=0.5)
+        self.clear_table()
+        self.show_snapshot(self.city_var.get())
+        self.start_getting_weather()
+    
+    def flush_updates(self, logs: list, rows: list):
+        """Вывод накопленных за кадр строк лога и таблицы"""
+        self.log_messages(logs)
+        if not rows:
+            return
+        self.table_model.add(rows)
+        self.render_table()
+        for data, _ in rows:
+            self.running_averages.add(data)
+        # Оценка обновляется сразу, без ожидания самого медленного источника
+        self.update_averages(self.running_averages.averages())
+        self.stats_label.config(text=f"Источников: {self.running_averages.sources}")
+    
+    def resize_table_slots(self, count: int):
+        """Число строк виджета равно числу видимых строк, а не размеру данных"""
+        count = max(1, count)
+        while len(self.table_slots) < count:
+            self.table_slots.append(self.tree.insert("", tk.END, values=()))
+        while len(self.table_slots) > count:
+            self.tree.delete(self.table_slots.pop())
+        self.render_table()
+    
+    def render_table(self):
+        """Вывод видимого окна модели в существующие строки виджета"""
+        page = len(self.table_slots)
+        total = len(self.table_model)
+        self.table_offset = max(0, min(self.table_offset, total - page))
+        window = self.table_model.window(self.table_offset, page)
         
-        # Добавление строки
-        item = self.tree.insert("", tk.END, values=values)
+        for index, iid in enumerate(self.table_slots):
+            if index < len(window):
+                data, status = window[index]
+                self.tree.item(iid, values=TableModel.format_row(data, status),
+                               tags=(status if status in TableModel.STATUS_TEXT else 'error',))
+                self.tree.move(iid, "", index)
+            else:
+                self.tree.detach(iid)
         
-        # Цвета в зависимости от статуса
-        if status == "success":
-            self.tree.item(item, tags=('success',))
-        elif status == "generated":
-            self.tree.item(item, tags=('generated',))
+        if total > page:
+            self.tree_scroll_y.set(self.table_offset / total, (self.table_offset + page) / total)
         else:
-            self.tree.item(item, tags=('error',))
+            self.tree_scroll_y.set(0, 1)
         
-        # Конфигурация тегов
-        self.tree.tag_configure('success', background='#d5f4e6')
-        self.tree.tag_configure('generated', background='#fff9e6')
-        self.tree.tag_configure('error', background='#fadbd8')
+        if self.table_metrics is None and window and self.table_height:
+            # Первая отрисованная строка дает точные размеры - окно пересчитывается
+            self.root.after_idle(self.fit_table_slots)
+    
+    def scroll_table(self, action: str, amount, unit: Optional[str] = None):
+        """Команда полосы прокрутки: moveto <доля> или scroll <n> units|pages"""
+        page = len(self.table_slots)
+        if action == "moveto":
+            self.table_offset = int(float(amount) * len(self.table_model))
+        elif action == "scroll":
+            step = page if unit == "pages" else 1
+            self.table_offset += int(amount) * step
+        self.render_table()
+    
+    def on_table_wheel(self, event):
+        if getattr(event, 'num', None) == 4:
+            units = -1
+        elif getattr(event, 'num', None) == 5:
+            units = 1
+        else:
+            units = -1 if event.delta > 0 else 1
+        self.scroll_table("scroll", units * 3, "units")
+        return "break"
+    
+    def on_table_resize(self, event):
+        self.table_height = event.height
+        self.fit_table_slots()
+    
+    def fit_table_slots(self):
+        """Число строк виджета по высоте таблицы и измеренной высоте строки"""
+        header, row = self.measure_table_rows()
+        rows = (self.table_height - header) // row
+        if rows != len(self.table_slots):
+            self.resize_table_slots(rows)
+    
+    def measure_table_rows(self) -> tuple:
+        """Высота заголовка и строки таблицы: по первой видимой строке или по стилю"""
+        if self.table_metrics is not None:
+            return self.table_metrics
+        bbox = self.tree.bbox(self.table_slots[0]) if self.table_slots else ''
+        if bbox:
+            # Верх первой строки - это высота заголовка вместе с рамкой
+            _, top, _, height = bbox
+            self.table_metrics = (top, max(1, height))
+            return self.table_metrics
+        try:
+            row = int(ttk.Style().lookup('Treeview', 'rowheight'))
+        except (ValueError, tk.TclError):
+            row = self.TABLE_ROW_HEIGHT
+        return self.TABLE_HEADER_HEIGHT, max(1, row)
+    
+    def sort_table(self, column: str):
+        """Сортировка по щелчку на заголовке колонки"""
+        self.table_model.sort_by(column)
+        for col in TableModel.COLUMNS:
+            arrow = ""
+            if col == self.table_model.sort_column:
+                arrow = " ▼" if self.table_model.sort_reverse else " ▲"
+            self.tree.heading(col, text=col + arrow)
+        self.table_offset = 0
+        self.render_table()
+    
+    def apply_table_filter(self):
+        self.table_model.set_filter(self.filter_var.get())
+        self.table_offset = 0
+        self.render_table()
     
     def update_averages(self, averages: dict):
         """Обновление отображения средних значений"""
@@ -1217,20 +4188,69 @@ class WeatherApp:
     
     def clear_table(self):
         """Очистка таблицы"""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        self.table_model.clear()
+        self.table_offset = 0
+        self.render_table()
         
         for key in self.avg_labels:
             self.avg_labels[key].config(text="---", fg='#7f8c8d')
         
         self.stats_label.config(text="Источников: 0")
         self.average_data = {}
+        self.average_stats = {}
+        self.running_averages.reset()
         self.weather_data = []
     
+    def show_metrics(self):
+        """Окно с метриками источников за время работы приложения"""
+        window = tk.Toplevel(self.root)
+        window.title("Метрики источников")
+        window.geometry("900x400")
+        
+        text = scrolledtext.ScrolledText(window, wrap=tk.NONE, font=('Consolas', 9))
+        text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+        
+        def refresh():
+            text.config(state='normal')
+            text.delete("1.0", tk.END)
+            text.insert(tk.END, self.format_metrics())
+            text.config(state='disabled')
+        
+        tk.Button(window, text="Обновить", command=refresh).pack(pady=(0, 10))
+        refresh()
+    
+    @staticmethod
+    def format_metrics() -> str:
+        def ms(value):
+            return f"{value * 1000:.0f}" if value is not None else "-"
+        
+        header = (f"{'Источник':<22}{'Запросов':>9}{'Успех':>7}{'Ген.':>6}{'Поля':>6}{'Кэш':>6}{'КБ':>8}{'Стоп':>6}"
+                  f"{'p50 мс':>8}{'p95 мс':>8}{'TTFB':>7}{'Загр.':>7}{'Разбор':>8}{'Извл.':>7}"
+                  f"{'Таймаут':>9}  Состояние")
+        lines = [header, "-" * len(header)]
+        for source, stats in WeatherScraper.metrics.summary().items():
+            rate = stats['success_rate']
+            stages = stats['stages']
+            lines.append(
+                f"{source[:21]:<22}{stats['requests']:>9}"
+                f"{(f'{rate:.0%}' if rate is not None else '-'):>7}"
+                f"{stats['fallbacks']:>6}{stats['generated_fields']:>6}{stats['cache_hits']:>6}{stats['bytes'] / 1024:>8.0f}{stats['early_stops']:>6}"
+                f"{ms(stats['p50']):>8}{ms(stats['p95']):>8}"
+                f"{ms(stages.get('ttfb')):>7}{ms(stages.get('download')):>7}"
+                f"{ms(stages.get('parse')):>8}{ms(stages.get('extract')):>7}"
+                f"{WeatherScraper.health.timeouts(source, WeatherScraper.CONNECT_TIMEOUT, WeatherScraper.READ_TIMEOUT)[1]:>9.1f}"
+                f"  {WeatherScraper.health.state(source)}"
+            )
+        if len(lines) == 2:
+            lines.append("Данных пока нет")
+        return "\n".join(lines) + "\n"
+    
     def clear_all(self):
         """Очистка всего"""
         self.clear_table()
+        self.log_buffer.clear()
         self.log_text.delete(1.0, tk.END)
+        self.log_lines = 0
         self.log_message("Все данные очищены", "INFO")
     
     def save_data(self):
@@ -1260,7 +4280,8 @@ class WeatherApp:
                     }
                     for data in self.weather_data
                 ],
-                "averages": self.average_data
+                "averages": self.average_data,
+                "statistics": self.average_stats
             }
             
             with open(filename, 'w', encoding='utf-8') as f:
@@ -1280,42 +4301,19 @@ class WeatherApp:
             self.log_message(f"Ошибка при сохранении: {str(e)}", "ERROR")
             messagebox.showerror("Ошибка", f"Не удалось сохранить данные:\n{str(e)}")
     
-    def save_to_history(self):
+    def save_to_history(self, city: str):
         """Сохранение данных в историю"""
         try:
-            history_file = "weather_history.json"
-            history = []
-            
-            if os.path.exists(history_file):
-                with open(history_file, 'r', encoding='utf-8') as f:
-                    history = json.load(f)
-            
-            history_entry = {
-                "city": self.city_var.get(),
-                "timestamp": datetime.now().isoformat(),
-                "sources_count": len(self.weather_data),
-                "averages": self.average_data
-            }
-            
-            history.append(history_entry)
-            
-            # Ограничиваем историю последними 50 записями
-            if len(history) > 50:
-                history = history[-50:]
-            
-            with open(history_file, 'w', encoding='utf-8') as f:
-                json.dump(history, f, ensure_ascii=False, indent=2)
-                
+            save_history_entry(city, len(self.weather_data), self.average_data)
         except Exception as e:
             print(f"Ошибка при сохранении истории: {e}")
 
-def main():
-    """Основная функция"""
-    # Проверка зависимостей
-    try:
-        import requests
-        from bs4 import BeautifulSoup
-    except ImportError:
+def run_gui(args: Optional[argparse.Namespace] = None):
+    """Запуск графического интерфейса"""
+    load_tk()
+    
+    # Проверка зависимостей без импорта: библиотеки загрузятся к первому обновлению
+    if any(importlib.util.find_spec(module) is None for module in ("requests", "bs4")):
         print("Ошибка: Не установлены необходимые библиотеки.")
         print("Установите их командой: pip install requests beautifulsoup4")
         input("Нажмите Enter для выхода...")
@@ -1331,7 +4329,12 @@ def main():
     root.minsize(1100, 700)
     
     # Создание приложения
-    app = WeatherApp(root)
+    if args is not None:
+        app = WeatherApp(root, log_size=args.log_size, log_file=args.log_file,
+                         show_startup_report=args.startup_report,
+                         snapshot_file=args.snapshot_file or None)
+    else:
+        app = WeatherApp(root)
     
     # Центрирование окна
     root.update_idletasks()
@@ -1344,11 +4347,127 @@ def main():
     # Обработка закрытия окна
     def on_closing():
         if messagebox.askokcancel("Выход", "Вы уверены, что хотите выйти?"):
+            app.cancel_refresh()
+            WeatherScraper.close_session()
+            app.log_buffer.close()
             root.destroy()
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
     
     root.mainloop()
 
+def parse_range(text: str) -> tuple:
+    """'0.1' или '0.05,0.3' -> (от, до)"""
+    try:
+        values = [float(part) for part in text.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается число или 'от,до': {text}")
+    if len(values) == 1:
+        values *= 2
+    if len(values) != 2 or values[0] > values[1] or values[0] < 0:
+        raise argparse.ArgumentTypeError(f"ожидается число или 'от,до': {text}")
+    return tuple(values)
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Разбор аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="Агрегатор погоды - 10 источников")
+    parser.add_argument("--headless", action="store_true",
+                        help="сбор данных без графического интерфейса")
+    parser.add_argument("--cities", default=CITIES[DEFAULT_CITY].name,
+                        help="города через запятую (по умолчанию: %(default)s)")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="период опроса в секундах; 0 - один проход")
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="общий лимит времени на один проход, секунд (по умолчанию без лимита)")
+    parser.add_argument("--workers", type=int, default=16,
+                        help="одновременных задач город x источник (по умолчанию: %(default)s)")
+    parser.add_argument("--per-host", type=int, default=WeatherScraper.HOST_CONCURRENCY,
+                        help="одновременных запросов к одному сайту (по умолчанию: %(default)s)")
+    parser.add_argument("--output", choices=("stdout", "history", "both"), default="stdout",
+                        help="куда записывать результаты")
+    parser.add_argument("--history-file", default=HISTORY_FILE,
+                        help="файл базы истории (по умолчанию: %(default)s)")
+    parser.add_argument("--report", choices=tuple(HistoryStore.BUCKETS),
+                        help="вместо сбора вывести агрегаты истории по часам или дням")
+    parser.add_argument("--since", type=float, default=0,
+                        help="период отчета в часах от текущего момента; 0 - вся история")
+    parser.add_argument("--quiet", action="store_true",
+                        help="не выводить лог в stderr")
+    parser.add_argument("--log-size", type=int, default=LOG_BUFFER_SIZE,
+                        help="записей журнала в памяти (по умолчанию: %(default)s)")
+    parser.add_argument("--log-file",
+                        help="дописывать полный журнал в файл")
+    parser.add_argument("--snapshot-file", default=SNAPSHOT_FILE,
+                        help="снимок последних данных для быстрого запуска окна; '' - не сохранять")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="вывести в stderr время импорта библиотек и этапов запуска")
+    parser.add_argument("--metrics-file",
+                        help="после каждого прохода записывать метрики источников "
+                             "в формате Prometheus (для textfile-коллектора)")
+    
+    bench = parser.add_argument_group("замеры производительности")
+    bench.add_argument("--bench", action="store_true",
+                       help="замерить разбор и сквозной проход на локальных страницах без сети")
+    bench.add_argument("--bench-iterations", type=int, default=30,
+                       help="повторов разбора каждой страницы (по умолчанию: %(default)s)")
+    bench.add_argument("--bench-refreshes", type=int, default=5,
+                       help="сквозных проходов через локальный стенд (по умолчанию: %(default)s)")
+    bench.add_argument("--seed", type=int, default=42,
+                       help="зерно генератора страниц и случайных значений (по умолчанию: %(default)s)")
+    bench.add_argument("--fixtures",
+                       help="каталог страниц, сохраненных через --record, вместо синтетических")
+    bench.add_argument("--record", metavar="DIR",
+                       help="сохранить живые страницы источников для первого города в каталог")
+    bench.add_argument("--bench-output",
+                       help="записать результаты в JSON (можно использовать как эталон)")
+    bench.add_argument("--baseline",
+                       help="JSON эталона; замедление больше --tolerance - код возврата 1")
+    bench.add_argument("--tolerance", type=float, default=0.25,
+                       help="допустимое замедление относительно эталона (по умолчанию: %(default)s)")
+    
+    stand_in = parser.add_argument_group("локальный стенд и нагрузка")
+    stand_in.add_argument("--load", action="store_true",
+                          help="нагрузочный прогон сборщика по городам --cities через локальный стенд")
+    stand_in.add_argument("--load-clients", type=int, default=20,
+                          help="одновременных обновлений (по умолчанию: %(default)s)")
+    stand_in.add_argument("--load-rounds", type=int, default=5,
+                          help="раундов обновлений (по умолчанию: %(default)s)")
+    stand_in.add_argument("--no-cache", action="store_true",
+                          help="без кэша страниц: каждое обновление загружает страницы заново")
+    stand_in.add_argument("--no-coalesce", action="store_true",
+                          help="без объединения одинаковых запросов разных клиентов")
+    stand_in.add_argument("--mock-serve", action="store_true",
+                          help="запустить стенд в этом процессе до Ctrl+C")
+    stand_in.add_argument("--mock-port", type=int, default=8765,
+                          help="порт стенда для --mock-serve (по умолчанию: %(default)s)")
+    stand_in.add_argument("--mock-latency", type=parse_range, default=(0.05, 0.3),
+                          help="задержка ответа стенда, секунд: 'от,до' (по умолчанию: 0.05,0.3)")
+    stand_in.add_argument("--mock-error-rate", type=float, default=0.05,
+                          help="доля ответов 500/503 (по умолчанию: %(default)s)")
+    stand_in.add_argument("--mock-throttle", type=float, default=0,
+                          help="запросов в секунду на сайт, сверх - 429; 0 - без ограничения")
+    stand_in.add_argument("--stand-in", metavar="URL",
+                          help="направлять запросы к сайтам на стенд (адрес из --mock-serve)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Основная функция"""
+    args = parse_args(argv)
+    if args.stand_in:
+        WeatherScraper.URL_OVERRIDE = args.stand_in
+    if args.mock_serve:
+        return serve_stand_in(args)
+    if args.load:
+        return run_load(args)
+    if args.record:
+        return record_fixtures(args)
+    if args.bench:
+        return run_benchmark(args)
+    if args.headless:
+        return run_headless(args)
+    run_gui(args)
+
+STARTUP_TIMES["загрузка модуля"] = time.perf_counter() - MODULE_STARTED
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file